@@ -0,0 +1,411 @@
+''' Offline benchmarks for collections and Route53 commits
+
+Scenarios run against FakeAccount, an in-process stand-in for AWS that
+answers API calls from each client's before-call event, the way the
+botocore Stubber does, so no request leaves the process. Answered calls
+skip the RateLimiter of their client, except in the paced scenarios,
+where FakeAccount paces them as real requests are. Accounts are
+synthetic and sized by the command line:
+
+    python -m aws.benchmark --zones 20 --records 500 --snapshots 5000 \\
+        --instances 5000 --output bench.json --baseline last.json
+
+Each scenario runs in its own process so peak memory is its own. The
+report holds throughput, API calls and latency percentiles (from
+aws.metrics) and peak memory per scenario, and is written as JSON.
+With a baseline report, scenarios whose throughput dropped by more
+than the tolerance are listed and the exit status is 1.
+'''
+
+import argparse
+import bisect
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import time
+from datetime import datetime, timedelta
+from functools import partial
+import botocore
+from botocore.awsrequest import AWSResponse
+from . import ec2
+from . import metrics
+from . import rds
+from . import route53
+from . import utils
+
+# page sizes and limits of the real APIs
+ROUTE53_ZONE_PAGE = 100
+ROUTE53_RECORD_PAGE = 300
+EC2_INSTANCE_PAGE = 1000
+RDS_SNAPSHOT_PAGE = 100
+
+# share of scenario throughput that may be lost against a baseline
+TOLERANCE = 0.2
+
+
+class FakeAccount(object):
+    ''' Synthetic AWS account answering Route53, EC2 and RDS calls
+
+    Holds zones x records hosted zone records, instances and
+    snapshots generated from seed. latency (seconds) is slept on
+    every call to stand in for the network. With pace set, every
+    call waits for the RateLimiter of its client first.
+    '''
+
+    SERVICES = (('client', 'route53'), ('resource', 'ec2'),
+                ('client', 'rds'))
+
+    def __init__(self, zones=10, records=100, instances=1000,
+                 snapshots=1000, latency=0, seed=0):
+        self.latency = latency
+        self.pace = False
+        self.calls = 0
+        rand = random.Random(seed)
+        epoch = datetime(2020, 1, 1)
+        self._zones = []
+        self._records = {}
+        for i in range(zones):
+            name = 'zone{}.example.com.'.format(i)
+            zone_id = 'Z{:08d}'.format(i)
+            self._zones.append({'Id': '/hostedzone/' + zone_id,
+                                'Name': name,
+                                'CallerReference': zone_id,
+                                'Config': {'PrivateZone': False},
+                                'ResourceRecordSetCount': records + 2})
+            self._records[zone_id] = {}
+            self._put(zone_id, {'Name': name, 'Type': 'NS', 'TTL': 172800,
+                                'ResourceRecords': [
+                                    {'Value': 'ns-1.awsdns-01.org.'}]})
+            self._put(zone_id, {'Name': name, 'Type': 'SOA', 'TTL': 900,
+                                'ResourceRecords': [
+                                    {'Value': 'ns-1.awsdns-01.org. 1 7200 '
+                                              '900 1209600 86400'}]})
+            for j in range(records):
+                self._put(zone_id, {
+                    'Name': 'host{}.{}'.format(j, name), 'Type': 'A',
+                    'TTL': 300, 'ResourceRecords': [{
+                        'Value': '10.{}.{}.{}'.format(
+                            i % 256, j // 256 % 256, j % 256)}]})
+        self._instances = [{
+            'InstanceId': 'i-{:017x}'.format(i),
+            'InstanceType': rand.choice(['t3.micro', 'm5.large',
+                                         'c5.xlarge', 'r5.2xlarge']),
+            'State': {'Code': 16, 'Name': 'running'},
+            'LaunchTime': epoch + timedelta(minutes=rand.randint(0, 10 ** 6)),
+            'Placement': {'AvailabilityZone': rand.choice(
+                ['us-east-1a', 'us-east-1b', 'us-east-1c'])},
+            'PrivateIpAddress': '10.1.{}.{}'.format(i // 256 % 256, i % 256),
+            'Tags': [{'Key': 'Name', 'Value': 'instance-{}'.format(i)}]}
+            for i in range(instances)]
+        self._snapshots = [{
+            'DBSnapshotIdentifier': 'snapshot-{}'.format(i),
+            'DBInstanceIdentifier': 'db-{}'.format(i % 50),
+            'SnapshotCreateTime':
+                epoch + timedelta(minutes=rand.randint(0, 10 ** 6)),
+            'Status': 'creating' if rand.random() < 0.05 else 'available',
+            'SnapshotType': rand.choice(['manual', 'automated']),
+            'Engine': 'postgres',
+            'AllocatedStorage': 100}
+            for i in range(snapshots)]
+        self._change_ids = 0
+
+    def install(self):
+        ''' Answer the calls of the shared utils connections '''
+        for connection_type, service in self.SERVICES:
+            connection = utils.get_connection(connection_type, service)
+            client = connection.meta.client \
+                if connection_type == 'resource' else connection
+            limiter = utils.get_rate_limiter(service,
+                                             client.meta.region_name)
+            events = client.meta.events
+            events.register('before-parameter-build', self._params)
+            events.register('before-call', partial(self._call, limiter))
+
+    def _params(self, params, context, **kwargs):
+        ''' Keep the API parameters; before-call only sees the request '''
+        context['fabboto_params'] = params
+
+    def _call(self, limiter, model, context, **kwargs):
+        ''' Return the (http, parsed) response for an API call '''
+        self.calls += 1
+        if self.pace:
+            limiter.acquire()
+            limiter.success()
+        if self.latency:
+            time.sleep(self.latency)
+        handler = getattr(self, '_' + botocore.xform_name(model.name), None)
+        if handler is None:
+            return (AWSResponse(None, 400, {}, None), {
+                'Error': {'Code': 'UnsupportedOperation',
+                          'Message': '{} is not faked'.format(model.name)},
+                'ResponseMetadata': {'HTTPStatusCode': 400}})
+        parsed = handler(**context.get('fabboto_params', {}))
+        parsed['ResponseMetadata'] = {'HTTPStatusCode': 200}
+        return AWSResponse(None, 200, {}, None), parsed
+
+    def _put(self, zone_id, record):
+        ''' Store a record set under its Route53 sort key '''
+        key = (route53._record_sort_key(record['Name']), record['Type'])
+        records = self._records[zone_id]
+        if key not in records:
+            keys = records.setdefault(None, [])
+            keys.insert(bisect.bisect(keys, key), key)
+        records[key] = record
+
+    def _list_hosted_zones(self, Marker=None, MaxItems=None):
+        limit = int(MaxItems or ROUTE53_ZONE_PAGE)
+        ids = [zone['Id'] for zone in self._zones]
+        start = ids.index(Marker) if Marker else 0
+        page = self._zones[start:start + limit]
+        response = {'HostedZones': page, 'MaxItems': str(limit),
+                    'IsTruncated': start + limit < len(ids)}
+        if response['IsTruncated']:
+            response['NextMarker'] = ids[start + limit]
+        return response
+
+    def _list_resource_record_sets(self, HostedZoneId, StartRecordName=None,
+                                   StartRecordType=None, MaxItems=None,
+                                   **kwargs):
+        limit = int(MaxItems or ROUTE53_RECORD_PAGE)
+        records = self._records[HostedZoneId.split('/')[-1]]
+        keys = records.get(None, [])
+        start = 0
+        if StartRecordName:
+            start = bisect.bisect_left(keys, (
+                route53._record_sort_key(StartRecordName),
+                StartRecordType or ''))
+        page = keys[start:start + limit]
+        response = {'ResourceRecordSets': [records[key] for key in page],
+                    'MaxItems': str(limit),
+                    'IsTruncated': start + limit < len(keys)}
+        if response['IsTruncated']:
+            name, record_type = keys[start + limit]
+            response['NextRecordName'] = records[name, record_type]['Name']
+            response['NextRecordType'] = record_type
+        return response
+
+    def _change_resource_record_sets(self, HostedZoneId, ChangeBatch):
+        zone_id = HostedZoneId.split('/')[-1]
+        records = self._records[zone_id]
+        for change in ChangeBatch['Changes']:
+            record = change['ResourceRecordSet']
+            if change['Action'] == 'DELETE':
+                key = (route53._record_sort_key(record['Name']),
+                       record['Type'])
+                records.pop(key)
+                records[None].remove(key)
+            else:
+                self._put(zone_id, record)
+        self._change_ids += 1
+        return {'ChangeInfo': {'Id': '/change/C{:08d}'.format(
+                                   self._change_ids),
+                               'Status': 'PENDING',
+                               'SubmittedAt': datetime.utcnow()}}
+
+    def _get_change(self, Id):
+        return {'ChangeInfo': {'Id': Id, 'Status': 'INSYNC',
+                               'SubmittedAt': datetime.utcnow()}}
+
+    def _describe_instances(self, NextToken=None, MaxResults=None,
+                            **kwargs):
+        limit = MaxResults or EC2_INSTANCE_PAGE
+        start = int(NextToken or 0)
+        page = self._instances[start:start + limit]
+        response = {'Reservations': [
+            {'ReservationId': 'r-{:017x}'.format(start + i),
+             'OwnerId': '123456789012',
+             'Instances': page[i:i + 4]}
+            for i in range(0, len(page), 4)]}
+        if start + limit < len(self._instances):
+            response['NextToken'] = str(start + limit)
+        return response
+
+    def _describe_db_snapshots(self, Marker=None, MaxRecords=None,
+                               **kwargs):
+        limit = MaxRecords or RDS_SNAPSHOT_PAGE
+        start = int(Marker or 0)
+        response = {'DBSnapshots': self._snapshots[start:start + limit]}
+        if start + limit < len(self._snapshots):
+            response['Marker'] = str(start + limit)
+        return response
+
+
+def _route53_records(account, options):
+    return sum(1 for _ in route53.Records(max_workers=options.workers))
+
+
+def _route53_find(account, options):
+    names = ['host{}.zone{}.example.com'.format(j, i)
+             for i in range(options.zones)
+             for j in range(0, options.records, max(options.records // 10,
+                                                    1))]
+    return sum(1 for _ in route53.Records(names=names,
+                                          max_workers=options.workers))
+
+
+def _route53_commit(account, options):
+    changes = route53.ChangeRecords(log=route53.QuietLog())
+    count = 0
+    for i in range(options.zones):
+        for j in range(options.records):
+            name = 'host{}.zone{}.example.com.'.format(j, i)
+            if j % 2:
+                changes.delete(name)
+            else:
+                changes.create(name, '192.0.2.{}'.format(j % 256), 'A')
+            count += 1
+    changes.commit(max_workers=options.workers)
+    return count
+
+
+def _rds_snapshots_latest(account, options):
+    # every snapshot is scanned to select the latest
+    rds.Snapshots().latest(10)
+    return options.snapshots
+
+
+def _rds_snapshots_paced(account, options):
+    account.pace = True
+    return _rds_snapshots_latest(account, options)
+
+
+def _ec2_instances(account, options):
+    return sum(1 for _ in ec2.Instances())
+
+
+def _ec2_instances_projected(account, options):
+    return sum(1 for _ in ec2.Instances(
+        fields=['InstanceId', 'InstanceType', 'State.Name']))
+
+
+SCENARIOS = [('route53_records', _route53_records),
+             ('route53_find', _route53_find),
+             ('route53_commit', _route53_commit),
+             ('rds_snapshots_latest', _rds_snapshots_latest),
+             ('rds_snapshots_paced', _rds_snapshots_paced),
+             ('ec2_instances', _ec2_instances),
+             ('ec2_instances_projected', _ec2_instances_projected)]
+
+
+def run_scenario(name, options):
+    ''' Run a scenario options.repeat times on a fresh FakeAccount
+        and return its results '''
+    scenario = dict(SCENARIOS)[name]
+    start_rss = _max_rss()
+    seconds = []
+    with metrics.measure() as measured:
+        for _ in range(options.repeat):
+            utils.reset()
+            account = FakeAccount(options.zones, options.records,
+                                  options.instances, options.snapshots,
+                                  options.latency)
+            account.install()
+            start = time.time()
+            items = scenario(account, options)
+            seconds.append(time.time() - start)
+    report = measured.report()
+    operations = dict((key, value) for key, value in report.items()
+                      if 'calls' in value)
+    best = min(seconds)
+    return {'items': items,
+            'runs': len(seconds),
+            'seconds': seconds,
+            'items_per_second': items / best if best else None,
+            'api_calls': sum(value['calls'] for value in operations.values()
+                             ) // len(seconds),
+            'api_latency': dict((key, value['latency'])
+                                for key, value in operations.items()),
+            'peak_rss_kb': _max_rss(),
+            'rss_growth_kb': _max_rss() - start_rss}
+
+
+def run(options, names=None):
+    ''' Run scenarios, each in its own process, and return the report '''
+    results = {}
+    for name in names or [name for name, _ in SCENARIOS]:
+        pool = multiprocessing.Pool(1)
+        try:
+            results[name] = pool.apply(run_scenario, (name, options))
+        finally:
+            pool.terminate()
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'botocore': botocore.__version__,
+            'options': vars(options),
+            'scenarios': results}
+
+
+def regressions(report, baseline, tolerance=TOLERANCE):
+    ''' Return (scenario, baseline, current) throughput for scenarios
+        slower than baseline by more than tolerance '''
+    slower = []
+    for name, result in sorted(report['scenarios'].items()):
+        before = baseline['scenarios'].get(name, {}).get('items_per_second')
+        after = result['items_per_second']
+        if before and after is not None and \
+                after < before * (1 - tolerance):
+            slower.append((name, before, after))
+    return slower
+
+
+def _max_rss():
+    ''' Return the peak resident set size of the process in kB '''
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--zones', type=int, default=10)
+    parser.add_argument('--records', type=int, default=500,
+                        help='records per zone')
+    parser.add_argument('--instances', type=int, default=5000)
+    parser.add_argument('--snapshots', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds added to every API call')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--scenario', action='append',
+                        choices=[name for name, _ in SCENARIOS],
+                        help='run only this scenario, may be repeated')
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--baseline', help='JSON report to compare with')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    options = parse_args(args)
+    # requests never leave the process, but clients still need these
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+    names, baseline, tolerance, output = (
+        options.scenario, options.baseline, options.tolerance,
+        options.output)
+    for key in ('scenario', 'baseline', 'tolerance', 'output'):
+        delattr(options, key)
+    report = run(options, names)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as stream:
+            stream.write(text + '\n')
+    else:
+        print(text)
+    if baseline:
+        with open(baseline) as stream:
+            slower = regressions(report, json.load(stream), tolerance)
+        for name, before, after in slower:
+            sys.stderr.write('{}: {:.1f} items/s, baseline {:.1f}\n'.format(
+                name, after, before))
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
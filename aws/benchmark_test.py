@@ -0,0 +1,60 @@
+import os
+import unittest
+import route53
+import utils
+from benchmark import FakeAccount, parse_args, regressions, run_scenario
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    ''' Test aws.benchmark scenarios against the fake account '''
+
+    def setUp(self):
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+
+    def tearDown(self):
+        utils.reset()
+
+    def test_scenarios(self):
+        options = parse_args(['--zones', '2', '--records', '350',
+                              '--instances', '10', '--snapshots', '150',
+                              '--repeat', '1'])
+        result = run_scenario('route53_records', options)
+        self.assertEqual(result['items'], 2 * 352)
+        # two record pages per zone and one zone page
+        self.assertEqual(result['api_calls'], 5)
+        self.assertIn('route53.ListResourceRecordSets',
+                      result['api_latency'])
+        self.assertEqual(run_scenario('rds_snapshots_latest',
+                                      options)['api_calls'], 2)
+        self.assertEqual(run_scenario('rds_snapshots_paced',
+                                      options)['api_calls'], 2)
+        self.assertEqual(run_scenario('ec2_instances_projected',
+                                      options)['items'], 10)
+
+    def test_commit(self):
+        utils.reset()
+        account = FakeAccount(zones=1, records=3, instances=0, snapshots=0)
+        account.install()
+        changes = route53.ChangeRecords(log=route53.QuietLog())
+        changes.delete('host1.zone0.example.com')
+        changes.create('new.zone0.example.com.', '192.0.2.1', 'A')
+        changes.commit()
+        names = [record['Name'] for record in route53.Records()]
+        self.assertEqual(names, ['zone0.example.com.', 'zone0.example.com.',
+                                 'host0.zone0.example.com.',
+                                 'host2.zone0.example.com.',
+                                 'new.zone0.example.com.'])
+
+    def test_regressions(self):
+        baseline = {'scenarios': {'a': {'items_per_second': 100},
+                                  'b': {'items_per_second': 100}}}
+        report = {'scenarios': {'a': {'items_per_second': 79},
+                                'b': {'items_per_second': 81},
+                                'c': {'items_per_second': 1}}}
+        self.assertEqual(regressions(report, baseline), [('a', 100, 79)])
+
+
+if __name__ == '__main__':
+    unittest.main()
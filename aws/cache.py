@@ -0,0 +1,142 @@
+''' Persistent inventory cache for AWS collections '''
+
+import cPickle as pickle
+import hashlib
+import os
+import sqlite3
+import stat
+import time
+from . import utils
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'fabboto',
+                            'inventory.sqlite')
+DEFAULT_TTL = 60
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class InventoryCache(object):
+    ''' SQLite backed cache of collection results
+
+    Entries expire after the TTL of their service and the least recently
+    used entries are evicted once the cache grows past max_bytes. Every
+    operation opens its own connection and SQLite locks the file, so one
+    cache file can be shared by the threads and processes of a user.
+    Entries are pickled, so the file is kept private to its owner and
+    files that other users could write to are refused.
+
+    Args:
+        path (Optional[str]):
+            location of the cache file. Default: DEFAULT_PATH
+        ttl (Optional[int]):
+            seconds entries stay valid. Default: DEFAULT_TTL
+        ttls (Optional[dict]):
+            per-service TTLs, e.g. {'route53': 300}. Default: None
+        max_bytes (Optional[int]):
+            total size of cached entries. Default: DEFAULT_MAX_BYTES
+    '''
+
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, ttls=None,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.ttls = ttls or {}
+        self.max_bytes = max_bytes
+        _make_private(path)
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS entries ('
+                         'key TEXT PRIMARY KEY, service TEXT, '
+                         'created REAL, accessed REAL, size INTEGER, '
+                         'value BLOB)')
+
+    def get(self, service, key, ttl=None):
+        ''' Return the cached items for key, or None if missing or expired.
+            ttl overrides the TTL of service. '''
+        key = _digest(key)
+        now = time.time()
+        if ttl is None:
+            ttl = self.ttls.get(service, self.ttl)
+        with self._connect() as conn:
+            row = conn.execute('SELECT created, value FROM entries '
+                               'WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[0] > ttl:
+                conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                return None
+            conn.execute('UPDATE entries SET accessed = ? WHERE key = ?',
+                         (now, key))
+        return pickle.loads(str(row[1]))
+
+    def set(self, service, key, items):
+        ''' Store items for key and evict entries over max_bytes '''
+        value = pickle.dumps(items, pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO entries '
+                         'VALUES (?, ?, ?, ?, ?, ?)',
+                         (_digest(key), service, now, now, len(value),
+                          sqlite3.Binary(value)))
+            self._evict(conn)
+
+    def clear(self, service=None):
+        ''' Remove all entries, or only those of service '''
+        with self._connect() as conn:
+            if service is None:
+                conn.execute('DELETE FROM entries')
+            else:
+                conn.execute('DELETE FROM entries WHERE service = ?',
+                             (service,))
+
+    def _evict(self, conn):
+        ''' Delete least recently used entries until under max_bytes '''
+        total = conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        expired = []
+        for key, size in conn.execute(
+                'SELECT key, size FROM entries ORDER BY accessed'):
+            if total <= self.max_bytes:
+                break
+            expired.append((key,))
+            total -= size
+        conn.executemany('DELETE FROM entries WHERE key = ?', expired)
+
+    def _connect(self):
+        ''' Return a connection to the cache file '''
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+
+def enable(**kwargs):
+    ''' Cache client collection results, see InventoryCache for kwargs '''
+    cache = InventoryCache(**kwargs)
+    utils.set_cache(cache)
+    return cache
+
+
+def disable():
+    ''' Stop caching collection results '''
+    utils.set_cache(None)
+
+
+def _make_private(path):
+    ''' Create path readable and writable by the current user only,
+        raising ValueError if another user could write to it '''
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0o700)
+    mode = os.stat(directory).st_mode
+    # others may only create files in a shared directory if it is sticky
+    if mode & (stat.S_IWGRP | stat.S_IWOTH) and not mode & stat.S_ISVTX:
+        raise ValueError('{} is writable by other users'.format(directory))
+    os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+    if os.stat(path).st_uid != os.getuid():
+        raise ValueError('{} is owned by another user'.format(path))
+    os.chmod(path, 0o600)
+
+
+def _digest(key):
+    ''' Return a fixed length digest of a cache key '''
+    return hashlib.sha1(key).hexdigest()
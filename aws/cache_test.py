@@ -0,0 +1,48 @@
+import os
+import stat
+import tempfile
+import unittest
+from cache import InventoryCache
+
+
+class InventoryCacheTestCase(unittest.TestCase):
+    ''' Test aws.cache.InventoryCache expiry and eviction '''
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_get_set(self):
+        cache = InventoryCache(self.path, ttls={'rds': -1})
+        cache.set('ec2', 'key', [{'Id': 1}])
+        self.assertEqual(cache.get('ec2', 'key'), [{'Id': 1}])
+        self.assertIsNone(cache.get('ec2', 'missing'))
+        cache.set('rds', 'key', [])
+        self.assertIsNone(cache.get('rds', 'key'))
+
+    def test_eviction(self):
+        cache = InventoryCache(self.path, max_bytes=150)
+        cache.set('ec2', 'old', ['x' * 50])
+        cache.set('ec2', 'new', ['x' * 50])
+        cache.get('ec2', 'old')
+        cache.set('ec2', 'newest', ['x' * 50])
+        self.assertIsNotNone(cache.get('ec2', 'old'))
+        self.assertIsNone(cache.get('ec2', 'new'))
+
+    def test_private(self):
+        os.chmod(self.path, 0o644)
+        InventoryCache(self.path)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+        directory = tempfile.mkdtemp()
+        try:
+            os.chmod(directory, 0o777)
+            self.assertRaises(ValueError, InventoryCache,
+                              os.path.join(directory, 'cache.sqlite'))
+        finally:
+            os.rmdir(directory)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,6 +18,7 @@ class Distributions(utils.CollectionBase):
                                             utils.str_to_list(domain_names))
 
     def _all(self):
-        return self.get_connection().get_paginator(
-            'list_distributions').paginate().search(
-                'DistributionList.Items[{}]'.format(self._jmes_filter))
+        return self._jmes_filter.search(
+            self.get_connection().get_paginator(
+                'list_distributions').paginate(),
+            'DistributionList.Items')
@@ -0,0 +1,131 @@
+''' Columnar export of collection results '''
+
+from array import array
+from collections import Counter
+from . import utils
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# array typecodes of the numeric column types
+TYPECODES = {'int': 'l', 'float': 'd', 'bool': 'b'}
+MISSING = {'int': 0, 'float': float('nan'), 'bool': 0}
+
+
+class ColumnTable(object):
+    ''' Typed column buffers built from collection items
+
+    Rows are appended incrementally, so tables can be filled page by page
+    from collections of any size. 'category' columns are dictionary
+    encoded: each distinct value is stored once and rows hold integer
+    codes, which keeps string columns compact and makes counting cheap.
+    Counts are vectorized with NumPy when it is installed.
+
+    Args:
+        fields (list or dict):
+            JMESPath expressions of the item fields, see utils.Projection
+        types (Optional[dict]):
+            column name to 'category', 'int', 'float' or 'bool'.
+            Default: 'category' for every column
+    '''
+
+    def __init__(self, fields, types=None):
+        self._projection = utils.Projection(fields)
+        self.names = list(self._projection.record._fields)
+        types = types or {}
+        self.types = dict((name, types.get(name, 'category'))
+                          for name in self.names)
+        self._columns = dict((name, array(TYPECODES.get(kind, 'l')))
+                             for name, kind in self.types.items())
+        self._codes = dict((name, {}) for name, kind in self.types.items()
+                           if kind == 'category')
+        self._categories = dict((name, []) for name in self._codes)
+        self.rows = 0
+
+    def append(self, item):
+        ''' Append a collection item (dictionary, resource or record) '''
+        record = self._projection(_raw(item))
+        for name, value in zip(self.names, record):
+            if name in self._codes:
+                codes = self._codes[name]
+                if value not in codes:
+                    codes[value] = len(codes)
+                    self._categories[name].append(value)
+                value = codes[value]
+            elif value is None:
+                value = MISSING[self.types[name]]
+            self._columns[name].append(value)
+        self.rows += 1
+
+    def extend(self, items):
+        ''' Append every item of an iterable '''
+        for item in items:
+            self.append(item)
+        return self
+
+    def codes(self, name):
+        ''' Return the raw buffer of a column; category codes for
+            category columns '''
+        return self._columns[name]
+
+    def categories(self, name):
+        ''' Return the distinct values of a category column, by code '''
+        return self._categories[name]
+
+    def column(self, name):
+        ''' Return the decoded values of a column as a list '''
+        if name in self._categories:
+            categories = self._categories[name]
+            return [categories[code] for code in self._columns[name]]
+        return self._columns[name].tolist()
+
+    def value_counts(self, name):
+        ''' Return a dictionary of category value to row count '''
+        return dict((key[0], count)
+                    for key, count in self.group_counts([name]).items())
+
+    def group_counts(self, names):
+        ''' Return a dictionary of row counts per combination of the
+            values of category columns names, keyed by value tuples '''
+        categories = [self._categories[name] for name in names]
+        if not self.rows:
+            return {}
+        if numpy is None:
+            counts = Counter(zip(*[self._columns[name] for name in names]))
+            return dict((tuple(c[code] for c, code in zip(categories, key)),
+                         count) for key, count in counts.items())
+        # unique rows of codes need memory per row, not per combination
+        codes = numpy.column_stack([self._numpy(name) for name in names])
+        keys, counts = numpy.unique(codes, axis=0, return_counts=True)
+        return dict((tuple(values[code] for values, code
+                           in zip(categories, key)), int(count))
+                    for key, count in zip(keys, counts))
+
+    def to_numpy(self):
+        ''' Return a NumPy structured array of the columns. Category
+            columns hold codes, decoded through categories(). '''
+        if numpy is None:
+            raise ImportError('to_numpy requires numpy')
+        table = numpy.empty(self.rows, dtype=[
+            (name, self._numpy(name).dtype) for name in self.names])
+        for name in self.names:
+            table[name] = self._numpy(name)
+        return table
+
+    def _numpy(self, name):
+        ''' Return a NumPy view of a column buffer without copying '''
+        column = self._columns[name]
+        return numpy.frombuffer(column, dtype=numpy.dtype(
+            '{}{}'.format('f' if column.typecode == 'd' else 'i',
+                          column.itemsize)))
+
+
+def _raw(item):
+    ''' Return the API dictionary behind a collection item '''
+    if hasattr(item, 'meta') and hasattr(item.meta, 'data'):
+        return item.meta.data
+    if hasattr(item, '_asdict'):
+        return item._asdict()
+    return item
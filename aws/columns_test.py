@@ -0,0 +1,60 @@
+import unittest
+import columns
+from columns import ColumnTable
+
+
+class ColumnTableTestCase(unittest.TestCase):
+    ''' Test aws.columns.ColumnTable encoding and counts '''
+
+    items = [{'Type': 'm5.large', 'AZ': 'a', 'Cpu': 2},
+             {'Type': 'm5.large', 'AZ': 'b', 'Cpu': 2},
+             {'Type': 'c5.xlarge', 'AZ': 'a', 'Cpu': 4},
+             {'Type': 'm5.large', 'AZ': 'a'}]
+
+    def table(self):
+        return ColumnTable(['Type', 'AZ', 'Cpu'],
+                           types={'Cpu': 'int'}).extend(self.items)
+
+    def check_counts(self):
+        table = self.table()
+        self.assertEqual(table.rows, 4)
+        self.assertEqual(table.categories('Type'), ['m5.large', 'c5.xlarge'])
+        self.assertEqual(list(table.codes('Type')), [0, 0, 1, 0])
+        self.assertEqual(table.column('Cpu'), [2, 2, 4, 0])
+        self.assertEqual(table.value_counts('Type'),
+                         {'m5.large': 3, 'c5.xlarge': 1})
+        self.assertEqual(table.group_counts(['Type', 'AZ']), {
+            ('m5.large', 'a'): 2, ('m5.large', 'b'): 1,
+            ('c5.xlarge', 'a'): 1})
+
+    def test_counts(self):
+        self.check_counts()
+
+    def test_high_cardinality_groups(self):
+        # 50k x 50k combinations would need a 20 GB bincount
+        items = [{'Type': str(i), 'AZ': str(-i)} for i in range(50000)]
+        table = ColumnTable(['Type', 'AZ']).extend(items)
+        counts = table.group_counts(['Type', 'AZ'])
+        self.assertEqual(len(counts), 50000)
+        self.assertEqual(counts[('7', '-7')], 1)
+
+    def test_empty(self):
+        table = ColumnTable(['Type', 'AZ']).extend([])
+        self.assertEqual(table.value_counts('Type'), {})
+        self.assertEqual(table.group_counts(['Type', 'AZ']), {})
+
+    def test_counts_without_numpy(self):
+        numpy, columns.numpy = columns.numpy, None
+        try:
+            self.check_counts()
+        finally:
+            columns.numpy = numpy
+
+    @unittest.skipIf(columns.numpy is None, 'numpy is not installed')
+    def test_to_numpy(self):
+        table = self.table().to_numpy()
+        self.assertEqual(list(table['Cpu']), [2, 2, 4, 0])
+        self.assertEqual(list(table['AZ']), [0, 1, 0, 0])
+
+if __name__ == '__main__':
+    unittest.main()
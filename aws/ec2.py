@@ -1,19 +1,49 @@
 ''' Tools for interacting with EC2 '''
 
+import threading
+import time
 from botocore.exceptions import ClientError
+from functools import partial
 from operator import attrgetter
 from . import utils
 
+# seconds the offered and probed instance types of a region stay valid
+INSTANCE_TYPES_TTL = 24 * 60 * 60
+
+# public SSM parameter holding the Amazon Linux 2 AMI of each region,
+# launched in dry runs to probe instance types
+PROBE_IMAGE_PARAMETER = \
+    '/aws/service/ami-amazon-linux-latest/amzn2-ami-hvm-x86_64-gp2'
+
+# ELB names per describe_tags call, and ELB enrichment calls in flight
+# per region across the process
+MAX_TAG_NAMES = 20
+MAX_ELB_CALLS_PER_REGION = 10
+
+_instance_types = {}
+_probed_types = {}
+_probe_images = {}
+_instance_types_lock = threading.Lock()
+_elb_slots = {}
+_elb_slots_lock = threading.Lock()
+
 
 class Instances(utils.CollectionBase):
-    ''' Get EC2 instances'''
+    ''' Get EC2 instances
+
+    Yields boto3 Instance resources, or with fields (see
+    utils.Projection) lightweight records built from the raw
+    describe_instances pages.
+    '''
 
     CONNECTION_TYPE = 'resource'
     SERVICE = 'ec2'
 
-    def __init__(self, ids=None, state=None, tags=None, filters=None):
+    def __init__(self, ids=None, state=None, tags=None, filters=None,
+                 fields=None):
         ''' Filter instances based on kwargs '''
         self._kwargs = {}
+        self._projection = utils.Projection(fields) if fields else None
         self._collection_filter = utils.CollectionFilter()
         if state:
             self._collection_filter.append('instance-state-name', state)
@@ -28,21 +58,33 @@ class Instances(utils.CollectionBase):
 
     def _all(self):
         ''' Return a collection of EC2 instances '''
+        if self._projection:
+            return self._projection.search(self.read_ahead(
+                self.get_connection().meta.client.get_paginator(
+                    'describe_instances').paginate(**self._kwargs)),
+                'Reservations[].Instances[]')
         return self.get_connection().instances.filter(**self._kwargs)
 
 
 class Snapshots(utils.CollectionBase):
-    ''' Get EC2 snapshots '''
+    ''' Get EC2 snapshots
+
+    Yields boto3 Snapshot resources, or with fields (see
+    utils.Projection) lightweight records built from the raw
+    describe_snapshots pages. latest() and oldest() on records
+    need StartTime among the fields.
+    '''
 
     CONNECTION_TYPE = 'resource'
     SERVICE = 'ec2'
 
-    def __init__(self, owner_ids=utils.get_account_id(), snapshot_ids=None,
-                 volume_ids=None, status=None, tags=None):
-        ''' Filter snapshots based on kwargs '''
+    def __init__(self, owner_ids='self', snapshot_ids=None,
+                 volume_ids=None, status=None, tags=None, fields=None):
+        ''' Filter snapshots based on kwargs.
+            owner_ids defaults to the current account ('self') '''
         self._kwargs = {}
+        self._projection = utils.Projection(fields) if fields else None
         self._collection_filter = utils.CollectionFilter()
-        self._collection_filter.append('owner-id', owner_ids)
         if volume_ids:
             self._collection_filter.append('volume-id', volume_ids)
         if status:
@@ -51,27 +93,53 @@ class Snapshots(utils.CollectionBase):
             self._collection_filter.append_dict(tags, tags=True)
         if snapshot_ids:
             self._kwargs['SnapshotIds'] = utils.str_to_list(snapshot_ids)
+        if owner_ids:
+            self._kwargs['OwnerIds'] = utils.str_to_list(owner_ids)
         self._kwargs['Filters'] = self._collection_filter.filters
 
     def _all(self):
         ''' Return a collection of ec2 snapshots '''
+        if self._projection:
+            return self._projection.search(self.read_ahead(
+                self.get_connection().meta.client.get_paginator(
+                    'describe_snapshots').paginate(**self._kwargs)),
+                'Snapshots[]')
         return self.get_connection().snapshots.filter(**self._kwargs)
 
-    def latest(self):
-        ''' Return the most recent snapshot in the collection '''
-        return sorted(self._all(), key=attrgetter('start_time'))[-1]
+    def latest(self, n=None):
+        ''' Return the most recent snapshot in the collection,
+            or a list of the n most recent, newest first '''
+        return utils.select(self._all(), self._start_time(), n)
+
+    def oldest(self, n=None):
+        ''' Return the oldest snapshot in the collection,
+            or a list of the n oldest, oldest first '''
+        return utils.select(self._all(), self._start_time(), n,
+                            largest=False)
+
+    def _start_time(self):
+        ''' Return the sort key for snapshot start times '''
+        if self._projection:
+            return attrgetter('StartTime')
+        return attrgetter('start_time')
 
 
 class Images(utils.CollectionBase):
-    ''' Get AMIs '''
+    ''' Get AMIs
+
+    Yields boto3 Image resources, or with fields (see utils.Projection)
+    lightweight records built from the raw describe_images response.
+    '''
 
     CONNECTION_TYPE = 'resource'
     SERVICE = 'ec2'
 
-    def __init__(self, owner_ids=utils.get_account_id(), image_ids=None,
-                 tags=None, state=None, filters=None):
-        ''' Filter AMIs based on kwargs '''
+    def __init__(self, owner_ids='self', image_ids=None,
+                 tags=None, state=None, filters=None, fields=None):
+        ''' Filter AMIs based on kwargs.
+            owner_ids defaults to the current account ('self') '''
         self._kwargs = {}
+        self._projection = utils.Projection(fields) if fields else None
         self._collection_filter = utils.CollectionFilter()
         if state:
             self._collection_filter.append('state', state)
@@ -88,34 +156,197 @@ class Images(utils.CollectionBase):
 
     def _all(self):
         ''' Return a collection of AMIs '''
+        if self._projection:
+            # describe_images is not paginated
+            return self._projection.search(
+                [self.get_connection().meta.client.describe_images(
+                    **self._kwargs)],
+                'Images[]')
         return self.get_connection().images.filter(**self._kwargs)
 
 
 class ElasticLoadBalancers(utils.CollectionBase):
-    ''' Get ELBs '''
+    ''' Get ELBs
+
+    With tags=True each ELB dictionary also gets its Tags, looked up
+    MAX_TAG_NAMES names per describe_tags call. With health=True it
+    gets the InstanceStates from describe_instance_health. Batches of
+    ELBs are enriched by up to max_workers threads, with at most
+    MAX_ELB_CALLS_PER_REGION calls in flight per region, and yielded
+    as they complete. ELBs deleted while enriching are skipped.
+    '''
 
     CONNECTION_TYPE = 'client'
     SERVICE = 'elb'
 
-    def __init__(self, names=None):
+    def __init__(self, names=None, tags=False, health=False, max_workers=10):
         ''' Filter ELBs based on kwargs '''
         self._kwargs = {}
+        self._tags = tags
+        self._health = health
+        self._max_workers = max_workers
         if names:
             self._kwargs['LoadBalancerNames'] = utils.str_to_list(names)
 
     def _all(self):
-        ''' Return a generator that yields ELB dictionaries '''
-        return self.get_connection().get_paginator(
-            'describe_load_balancers').paginate(**self._kwargs).search(
-                'LoadBalancerDescriptions[]')
+        ''' Generator function that yields ELB dictionaries '''
+        pages = self.read_ahead(self.get_connection().get_paginator(
+            'describe_load_balancers').paginate(**self._kwargs))
+        if not self._tags and not self._health:
+            for page in pages:
+                for elb in page['LoadBalancerDescriptions']:
+                    yield elb
+            return
+        region = self.get_connection().meta.region_name
+        slots = _region_slots(region)
+        backoff = utils.AdaptiveBackoff('elb', region)
+        for page in pages:
+            elbs = utils.iter_concurrently(
+                [partial(self._enrich, batch, slots, backoff) for batch in
+                 utils.chunks(page['LoadBalancerDescriptions'],
+                              MAX_TAG_NAMES)],
+                max_workers=self._max_workers, ordered=False)
+            for elb in elbs:
+                yield elb
+
+    def _enrich(self, elbs, slots, backoff):
+        ''' Generator function that yields a batch of ELBs with their
+            tags and instance health '''
+        connection = self.get_connection()
+        if self._tags:
+            tags = self._describe_tags(
+                [elb['LoadBalancerName'] for elb in elbs], slots, backoff)
+        for elb in elbs:
+            name = elb['LoadBalancerName']
+            if self._tags:
+                if name not in tags:
+                    continue
+                elb['Tags'] = tags[name]
+            if self._health:
+                try:
+                    elb['InstanceStates'] = backoff.call(
+                        _call_with_slot, slots,
+                        connection.describe_instance_health,
+                        LoadBalancerName=name)['InstanceStates']
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'LoadBalancerNotFound':
+                        raise
+                    continue
+            yield elb
+
+    def _describe_tags(self, names, slots, backoff):
+        ''' Return the tags of each ELB name that still exists '''
+        try:
+            descriptions = backoff.call(
+                _call_with_slot, slots,
+                self.get_connection().describe_tags,
+                LoadBalancerNames=names)['TagDescriptions']
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'LoadBalancerNotFound':
+                raise
+            # one missing name fails the whole batch, so retry singly
+            if len(names) == 1:
+                return {}
+            tags = {}
+            for name in names:
+                tags.update(self._describe_tags([name], slots, backoff))
+            return tags
+        return dict((description['LoadBalancerName'], description['Tags'])
+                    for description in descriptions)
+
 
+def _region_slots(region):
+    ''' Return the semaphore limiting ELB enrichment calls in region '''
+    with _elb_slots_lock:
+        if region not in _elb_slots:
+            _elb_slots[region] = threading.BoundedSemaphore(
+                MAX_ELB_CALLS_PER_REGION)
+        return _elb_slots[region]
 
-def valid_instance_type(instance_type):
+
+def _call_with_slot(slots, func, **kwargs):
+    ''' Call func while holding one of slots '''
+    with slots:
+        return func(**kwargs)
+
+
+def get_instance_types(region=None, ttl=INSTANCE_TYPES_TTL):
+    ''' Return the set of instance types offered in region
+
+        Offerings are loaded in bulk, memoized per region for ttl seconds
+        and stored in the inventory cache when one is enabled.
+    '''
+    region = utils.get_connection('client', 'ec2',
+                                  region=region).meta.region_name
+    with _instance_types_lock:
+        if region in _instance_types:
+            types, loaded = _instance_types[region]
+            if time.time() - loaded < ttl:
+                return types
+        cache = utils.get_cache()
+        key = 'ec2.instance_types:{}'.format(region)
+        types = cache.get('ec2', key, ttl) if cache else None
+        if types is None:
+            types = frozenset(utils.get_connection(
+                'client', 'ec2', region=region).get_paginator(
+                    'describe_instance_type_offerings').paginate(
+                        LocationType='region').search(
+                            'InstanceTypeOfferings[].InstanceType'))
+            if cache:
+                cache.set('ec2', key, types)
+        _instance_types[region] = (types, time.time())
+        return types
+
+
+def valid_instance_type(instance_type, region=None, ttl=INSTANCE_TYPES_TTL):
     ''' Verify that instance_type is valid.
-        Invalid types raise a ClientError '''
+
+        Types are checked against the region's offered instance types;
+        types missing from the offerings are probed with a dry run, and
+        the result is memoized for ttl seconds.
+    '''
+    if instance_type in get_instance_types(region, ttl):
+        return True
+    region = utils.get_connection('client', 'ec2',
+                                  region=region).meta.region_name
+    key = (region, instance_type)
+    with _instance_types_lock:
+        if key in _probed_types:
+            valid, probed = _probed_types[key]
+            if time.time() - probed < ttl:
+                return valid
+    # probes run without the lock, a duplicate probe is harmless
+    valid = _probe_instance_type(instance_type, region)
+    with _instance_types_lock:
+        _probed_types[key] = (valid, time.time())
+    return valid
+
+
+def valid_instance_types(instance_types, region=None):
+    ''' Return a dictionary of instance type to validity '''
+    return dict((instance_type, valid_instance_type(instance_type, region))
+                for instance_type in set(instance_types))
+
+
+def _probe_image(region):
+    ''' Return an AMI of region to launch in dry runs '''
+    with _instance_types_lock:
+        if region in _probe_images:
+            return _probe_images[region]
+    image_id = utils.get_connection('client', 'ssm', region=region) \
+        .get_parameter(Name=PROBE_IMAGE_PARAMETER)['Parameter']['Value']
+    with _instance_types_lock:
+        _probe_images[region] = image_id
+    return image_id
+
+
+def _probe_instance_type(instance_type, region):
+    ''' Verify instance_type with a dry run launch in region.
+        Unexpected errors raise a ClientError '''
     try:
-        utils.get_connection('resource', 'ec2').create_instances(
-            DryRun=True, ImageId='ami-d05e75b8',
+        ec2 = utils.get_connection('resource', 'ec2', region=region)
+        ec2.create_instances(
+            DryRun=True, ImageId=_probe_image(region),
             MinCount=1, MaxCount=1, InstanceType=instance_type
         )
     except ClientError as e:
@@ -0,0 +1,225 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+import ec2
+import utils
+from botocore.exceptions import ClientError
+from cache import InventoryCache
+from ec2 import (ElasticLoadBalancers, Snapshots, get_instance_types,
+                 valid_instance_type, valid_instance_types)
+
+
+class FakeELB(object):
+    ''' describe_load_balancers, describe_tags and describe_instance_health
+        over a list of ELB names, some deleted after listing '''
+
+    class meta(object):
+        region_name = 'us-east-1'
+
+    def __init__(self, names, deleted=()):
+        self.names = names
+        self.deleted = set(deleted)
+        self.tag_calls = []
+        self._lock = threading.Lock()
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self):
+        return [{'LoadBalancerDescriptions': [
+            {'LoadBalancerName': name} for name in self.names]}]
+
+    def describe_tags(self, LoadBalancerNames):
+        with self._lock:
+            self.tag_calls.append(LoadBalancerNames)
+        if self.deleted.intersection(LoadBalancerNames):
+            raise self.not_found('DescribeTags')
+        return {'TagDescriptions': [
+            {'LoadBalancerName': name,
+             'Tags': [{'Key': 'Name', 'Value': name}]}
+            for name in LoadBalancerNames]}
+
+    def describe_instance_health(self, LoadBalancerName):
+        if LoadBalancerName in self.deleted:
+            raise self.not_found('DescribeInstanceHealth')
+        return {'InstanceStates': [{'InstanceId': 'i-1',
+                                    'State': 'InService'}]}
+
+    def not_found(self, operation):
+        return ClientError({'Error': {'Code': 'LoadBalancerNotFound'}},
+                           operation)
+
+
+class FakeEC2(object):
+    ''' EC2 resource recording describe_snapshots arguments '''
+
+    def __init__(self):
+        self.meta = self
+        self.client = self
+        self.calls = []
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, **kwargs):
+        self.calls.append(kwargs)
+        return [{'Snapshots': [{'SnapshotId': 'snap-1'}]}]
+
+
+class SnapshotsTestCase(unittest.TestCase):
+    ''' Test aws.ec2.Snapshots owner handling '''
+
+    def setUp(self):
+        self.fake = FakeEC2()
+        utils._connections[('ec2', 'resource', None, None, None)] = self.fake
+
+    def tearDown(self):
+        utils.reset()
+
+    def test_owner_ids(self):
+        snapshots = Snapshots(fields=['SnapshotId'])
+        self.assertEqual(self.fake.calls, [])
+        self.assertEqual([s.SnapshotId for s in snapshots], ['snap-1'])
+        # 'self' is resolved by EC2 in the account of the connection
+        self.assertEqual(self.fake.calls[0]['OwnerIds'], ['self'])
+        list(Snapshots(owner_ids=['1', '2'], fields=['SnapshotId']))
+        self.assertEqual(self.fake.calls[1]['OwnerIds'], ['1', '2'])
+        self.assertNotIn(('sts', 'client', None, None, None),
+                         utils._connections)
+
+
+class FakeOfferings(object):
+    ''' describe_instance_type_offerings and dry run launches '''
+
+    def __init__(self, types, region='us-east-1'):
+        self.meta = self
+        self.region_name = region
+        self.types = types
+        self.loads = 0
+        self.probes = []
+        self.images = []
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, LocationType):
+        self.loads += 1
+        return self
+
+    def search(self, expression):
+        return list(self.types)
+
+    def get_parameter(self, Name):
+        return {'Parameter': {'Value': 'ami-' + self.region_name}}
+
+    def create_instances(self, InstanceType, ImageId, **kwargs):
+        self.probes.append(InstanceType)
+        self.images.append(ImageId)
+        if InstanceType == 'new.large':
+            raise ClientError({'Error': {
+                'Code': 'DryRunOperation',
+                'Message': 'Request would have succeeded'}}, 'RunInstances')
+        raise ClientError({'Error': {
+            'Code': 'InvalidParameterValue', 'Message': 'invalid'}},
+            'RunInstances')
+
+
+class InstanceTypesTestCase(unittest.TestCase):
+    ''' Test aws.ec2 instance type validation '''
+
+    def setUp(self):
+        self.fake = FakeOfferings(['m5.large', 't3.micro'])
+        utils._connections[('ec2', 'client', None, None, None)] = self.fake
+        utils._connections[('ec2', 'client', 'us-east-1', None, None)] = \
+            self.fake
+        utils._connections[('ec2', 'resource', 'us-east-1', None, None)] = \
+            self.fake
+        utils._connections[('ssm', 'client', 'us-east-1', None, None)] = \
+            self.fake
+        self.eu = FakeOfferings([], 'eu-west-1')
+        for key in (('ec2', 'client'), ('ec2', 'resource'),
+                    ('ssm', 'client')):
+            utils._connections[key + ('eu-west-1', None, None)] = self.eu
+
+    def tearDown(self):
+        utils._connections.clear()
+        utils.set_cache(None)
+        ec2._instance_types.clear()
+        ec2._probed_types.clear()
+        ec2._probe_images.clear()
+
+    def test_ttl(self):
+        self.assertIn('m5.large', get_instance_types())
+        get_instance_types()
+        self.assertEqual(self.fake.loads, 1)
+        types, loaded = ec2._instance_types['us-east-1']
+        ec2._instance_types['us-east-1'] = (types, time.time() - 120)
+        get_instance_types(ttl=60)
+        self.assertEqual(self.fake.loads, 2)
+
+    def test_inventory_cache(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            utils.set_cache(InventoryCache(path))
+            types = get_instance_types()
+            ec2._instance_types.clear()
+            self.assertEqual(get_instance_types(), types)
+            self.assertEqual(self.fake.loads, 1)
+        finally:
+            os.remove(path)
+
+    def test_probe(self):
+        self.assertTrue(valid_instance_type('m5.large'))
+        self.assertEqual(self.fake.probes, [])
+        self.assertEqual(valid_instance_types(
+            ['new.large', 'bogus', 'new.large', 't3.micro']),
+            {'new.large': True, 'bogus': False, 't3.micro': True})
+        self.assertFalse(valid_instance_type('bogus'))
+        self.assertEqual(sorted(self.fake.probes), ['bogus', 'new.large'])
+        # probes expire with the offerings
+        valid, probed = ec2._probed_types['us-east-1', 'bogus']
+        ec2._probed_types['us-east-1', 'bogus'] = (valid, probed - 120)
+        self.assertFalse(valid_instance_type('bogus', ttl=60))
+        self.assertEqual(len(self.fake.probes), 3)
+        # dry runs launch an AMI of the region probed
+        self.assertFalse(valid_instance_type('bogus', region='eu-west-1'))
+        self.assertEqual(self.eu.images, ['ami-eu-west-1'])
+
+
+class ElasticLoadBalancersTestCase(unittest.TestCase):
+    ''' Test aws.ec2.ElasticLoadBalancers enrichment '''
+
+    def setUp(self):
+        self.names = ['elb-{}'.format(i) for i in range(45)]
+        self.fake = FakeELB(self.names, deleted=['elb-30'])
+        utils._connections[('elb', 'client', None, None, None)] = self.fake
+
+    def tearDown(self):
+        utils._connections.clear()
+
+    def test_enrich(self):
+        elbs = list(ElasticLoadBalancers(tags=True, health=True,
+                                         max_workers=3))
+        self.assertEqual(sorted(elb['LoadBalancerName'] for elb in elbs),
+                         sorted(set(self.names) - set(['elb-30'])))
+        self.assertTrue(all(elb['Tags'] and elb['InstanceStates']
+                            for elb in elbs))
+        # three batches, the failing one retried name by name
+        batches = [calls for calls in self.fake.tag_calls
+                   if len(calls) > 1]
+        self.assertEqual(sorted(len(calls) for calls in batches),
+                         [5, 20, 20])
+        self.assertEqual(len(self.fake.tag_calls), 3 + 20)
+
+    def test_plain(self):
+        elbs = list(ElasticLoadBalancers())
+        self.assertEqual(len(elbs), 45)
+        self.assertNotIn('Tags', elbs[0])
+        self.assertEqual(self.fake.tag_calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
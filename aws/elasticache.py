@@ -1,5 +1,7 @@
 ''' Tools for interacting with ElastiCache '''
 
+from botocore.exceptions import ClientError
+from functools import partial
 from . import utils
 
 
@@ -9,12 +11,13 @@ class CacheClusters(utils.CollectionBase):
     CONNECTION_TYPE = 'client'
     SERVICE = 'elasticache'
 
-    def __init__(self, ids=None, engines=None, classes=None):
-        ''' Filter cache clusters based on kwargs '''
+    def __init__(self, ids=None, engines=None, classes=None, max_workers=10):
+        ''' Filter cache clusters based on kwargs.
+            Each id is looked up with its own API call, up to max_workers
+            at a time; engines and classes are filtered client side. '''
+        self._ids = utils.str_to_list(ids)
+        self._max_workers = max_workers
         self._jmes_filter = utils.ProjectionFilter()
-        if ids:
-            self._jmes_filter.add_aggregate('CacheClusterId',
-                                            utils.str_to_list(ids))
         if engines:
             self._jmes_filter.add_filter('Engine', utils.str_to_list(engines))
         if classes:
@@ -23,9 +26,26 @@ class CacheClusters(utils.CollectionBase):
 
     def _all(self):
         ''' Return a generator that yields cache cluster dictionaries '''
-        return self.get_connection().get_paginator(
-            'describe_cache_clusters').paginate(ShowCacheNodeInfo=True).search(
-                'CacheClusters[{}]'.format(self._jmes_filter))
+        if not self._ids:
+            return self._clusters()
+        return utils.iter_concurrently(
+            [partial(self._clusters, cluster_id) for cluster_id in self._ids],
+            max_workers=self._max_workers)
+
+    def _clusters(self, cluster_id=None):
+        ''' Generator function that yields cache clusters, optionally
+            limited to a single cluster id '''
+        kwargs = {'ShowCacheNodeInfo': True}
+        if cluster_id:
+            kwargs['CacheClusterId'] = cluster_id
+        pages = self.read_ahead(self.get_connection().get_paginator(
+            'describe_cache_clusters').paginate(**kwargs))
+        try:
+            for cluster in self._jmes_filter.search(pages, 'CacheClusters'):
+                yield cluster
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'CacheClusterNotFound':
+                raise
 
 
 class ReplicationGroups(utils.CollectionBase):
@@ -42,6 +62,7 @@ class ReplicationGroups(utils.CollectionBase):
 
     def _all(self):
         ''' Return a generator that yields replication group dictionaries '''
-        return self.get_connection().get_paginator(
-            'describe_replication_groups').paginate().search(
-                'ReplicationGroups[{}]'.format(self._jmes_filter))
+        return self._jmes_filter.search(
+            self.get_connection().get_paginator(
+                'describe_replication_groups').paginate(),
+            'ReplicationGroups')
@@ -0,0 +1,40 @@
+import unittest
+import utils
+from botocore.exceptions import ClientError
+from elasticache import CacheClusters
+
+
+class FakeElastiCache(object):
+    ''' describe_cache_clusters knowing only the clusters in ids '''
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, CacheClusterId, ShowCacheNodeInfo):
+        if CacheClusterId not in self.ids:
+            raise ClientError({'Error': {'Code': 'CacheClusterNotFound'}},
+                              'DescribeCacheClusters')
+        yield {'CacheClusters': [{'CacheClusterId': CacheClusterId,
+                                  'Engine': 'redis'}]}
+
+
+class CacheClustersTestCase(unittest.TestCase):
+    ''' Test aws.elasticache.CacheClusters lookups by id '''
+
+    def setUp(self):
+        utils._connections[('elasticache', 'client', None, None, None)] = \
+            FakeElastiCache(['a', 'c'])
+
+    def tearDown(self):
+        utils._connections.clear()
+
+    def test_missing_ids(self):
+        clusters = CacheClusters(ids=['a', 'missing', 'c'], max_workers=2)
+        self.assertEqual([c['CacheClusterId'] for c in clusters], ['a', 'c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
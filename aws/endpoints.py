@@ -0,0 +1,179 @@
+''' Index of Route53 records and the AWS resources they point to '''
+
+from functools import partial
+from . import cloudfront
+from . import ec2
+from . import elasticache
+from . import rds
+from . import route53
+from . import utils
+
+
+def _elb_endpoints(elb):
+    return [elb.get('DNSName')]
+
+
+def _distribution_endpoints(distribution):
+    return [distribution.get('DomainName')]
+
+
+def _db_instance_endpoints(instance):
+    return [instance.get('Endpoint', {}).get('Address')]
+
+
+def _cache_cluster_endpoints(cluster):
+    return [cluster.get('ConfigurationEndpoint', {}).get('Address')] + \
+        [node.get('Endpoint', {}).get('Address')
+         for node in cluster.get('CacheNodes', [])]
+
+
+def _replication_group_endpoints(group):
+    endpoints = [group.get('ConfigurationEndpoint', {}).get('Address')]
+    for node_group in group.get('NodeGroups', []):
+        for key in ('PrimaryEndpoint', 'ReaderEndpoint'):
+            endpoints.append(node_group.get(key, {}).get('Address'))
+    return endpoints
+
+
+# service name: (collection, function returning a resource's DNS names)
+SERVICES = {
+    'elb': (ec2.ElasticLoadBalancers, _elb_endpoints),
+    'cloudfront': (cloudfront.Distributions, _distribution_endpoints),
+    'rds': (rds.Instances, _db_instance_endpoints),
+    'elasticache': (elasticache.CacheClusters, _cache_cluster_endpoints),
+    'replication_groups': (elasticache.ReplicationGroups,
+                           _replication_group_endpoints),
+}
+
+
+class EndpointIndex(object):
+    ''' Join Route53 records to the resources their targets point to
+
+    Records and each service are listed once into hash indexes keyed by
+    normalized DNS name, so forward (record to resources) and reverse
+    (resource to records) lookups do not rescan anything. Alias targets
+    and CNAME values are matched against ELB DNSName, CloudFront
+    DomainName, RDS Endpoint.Address and ElastiCache cluster, node and
+    replication group endpoints.
+
+    refresh() re-lists everything, or only the services named, e.g.
+    refresh('route53') after DNS changes or refresh('rds'). A failing
+    service does not stop the others; its exception is stored in errors,
+    keyed by service, and its previous index is kept.
+
+    Args:
+        services (Optional[list]):
+            services to index, keys of SERVICES. Default: all
+        max_workers (Optional[int]):
+            services listed concurrently, and hosted zones scanned
+            concurrently by route53.Records. Default: 4
+    '''
+
+    def __init__(self, services=None, max_workers=4):
+        self._services = list(services or sorted(SERVICES))
+        self._max_workers = max_workers
+        self._resources = dict((service, {}) for service in self._services)
+        self._targets = {}
+        self._names = {}
+        self.errors = {}
+        self.refresh()
+
+    def refresh(self, *services):
+        ''' Re-list route53 records and the services given, or all '''
+        services = services or ['route53'] + self._services
+        unknown = set(services) - set(['route53'] + self._services)
+        if unknown:
+            raise ValueError('services not indexed: {}'.format(
+                ', '.join(sorted(unknown))))
+        for service in services:
+            self.errors.pop(service, None)
+        builds = utils.iter_concurrently(
+            [partial(self._build, service) for service in services],
+            max_workers=self._max_workers, ordered=False)
+        # indexes are replaced whole, so lookups never see partial ones
+        for service, index in builds:
+            if service == 'route53':
+                self._names, self._targets = index
+            else:
+                self._resources[service] = index
+
+    def resources(self, name):
+        ''' Return (service, resource) pairs the records of name point to,
+            following CNAMEs and aliases to other records in the index '''
+        found = []
+        seen = set()
+        pending = [normalize_endpoint(name)]
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            found.extend(self.endpoint(name))
+            for record in self._names.get(name, []):
+                pending.extend(record_targets(record))
+        return found
+
+    def endpoint(self, dns_name):
+        ''' Return (service, resource) pairs that own dns_name '''
+        dns_name = normalize_endpoint(dns_name)
+        return [(service, resource) for service in self._services
+                for resource in self._resources[service].get(dns_name, [])]
+
+    def records(self, service, resource):
+        ''' Return the records that target any endpoint of resource '''
+        records = []
+        for endpoint in _endpoints(service, resource):
+            records.extend(self._targets.get(endpoint, []))
+        return records
+
+    def _build(self, service):
+        ''' Generator function that yields (service, index) for service,
+            recording its error instead of raising it '''
+        try:
+            index = self._index(service)
+        except Exception as e:
+            self.errors[service] = e
+            return
+        yield service, index
+
+    def _index(self, service):
+        ''' Return the index of service '''
+        if service == 'route53':
+            names = {}
+            targets = {}
+            for record in route53.Records(max_workers=self._max_workers):
+                names.setdefault(normalize_endpoint(record['Name']),
+                                 []).append(record)
+                for target in record_targets(record):
+                    targets.setdefault(target, []).append(record)
+            return names, targets
+        index = {}
+        for resource in SERVICES[service][0]():
+            for endpoint in _endpoints(service, resource):
+                index.setdefault(endpoint, []).append(resource)
+        return index
+
+
+def _endpoints(service, resource):
+    ''' Return the normalized DNS names of a resource '''
+    return set(normalize_endpoint(name)
+               for name in SERVICES[service][1](resource) if name)
+
+
+def record_targets(record):
+    ''' Return the normalized DNS names a record points to '''
+    if 'AliasTarget' in record:
+        return [normalize_endpoint(record['AliasTarget']['DNSName'])]
+    if record.get('Type') == 'CNAME':
+        return [normalize_endpoint(value['Value'])
+                for value in record.get('ResourceRecords', [])]
+    return []
+
+
+def normalize_endpoint(name):
+    ''' Lowercase a DNS name and drop the trailing . and the dualstack.
+        prefix Route53 adds to ELB alias targets '''
+    name = name.lower().rstrip('.')
+    if name.startswith('dualstack.'):
+        return name[len('dualstack.'):]
+    return name
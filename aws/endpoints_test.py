@@ -0,0 +1,86 @@
+import unittest
+import endpoints
+from endpoints import EndpointIndex, normalize_endpoint
+
+
+class EndpointIndexTestCase(unittest.TestCase):
+    ''' Test aws.endpoints.EndpointIndex lookups '''
+
+    elb = {'LoadBalancerName': 'web',
+           'DNSName': 'web-1.us-east-1.elb.amazonaws.com'}
+    db = {'DBInstanceIdentifier': 'db',
+          'Endpoint': {'Address': 'db.abc.us-east-1.rds.amazonaws.com'}}
+    records = [
+        {'Name': 'www.example.com.', 'Type': 'A', 'AliasTarget': {
+            'DNSName': 'dualstack.WEB-1.us-east-1.elb.amazonaws.com.'}},
+        {'Name': 'db.example.com.', 'Type': 'CNAME', 'ResourceRecords': [
+            {'Value': 'db.abc.us-east-1.rds.amazonaws.com'}]},
+        {'Name': 'app.example.com.', 'Type': 'CNAME', 'ResourceRecords': [
+            {'Value': 'www.example.com'}]},
+        {'Name': 'mail.example.com.', 'Type': 'A', 'ResourceRecords': [
+            {'Value': '192.0.2.1'}]}]
+
+    def setUp(self):
+        self.services = dict(endpoints.SERVICES)
+        self.listed = []
+        endpoints.SERVICES['elb'] = (self.lister([self.elb]),
+                                     endpoints._elb_endpoints)
+        endpoints.SERVICES['rds'] = (self.lister([self.db]),
+                                     endpoints._db_instance_endpoints)
+        self.records_class = endpoints.route53.Records
+        endpoints.route53.Records = lambda **kwargs: self.lister(
+            self.records)()
+
+    def tearDown(self):
+        endpoints.SERVICES.clear()
+        endpoints.SERVICES.update(self.services)
+        endpoints.route53.Records = self.records_class
+
+    def lister(self, items):
+        def collection():
+            self.listed.append(items)
+            return iter(items)
+        return collection
+
+    def test_lookups(self):
+        index = EndpointIndex(services=['elb', 'rds'])
+        self.assertEqual(len(self.listed), 3)
+        self.assertEqual(index.resources('www.example.com'),
+                         [('elb', self.elb)])
+        self.assertEqual(index.resources('APP.example.com.'),
+                         [('elb', self.elb)])
+        self.assertEqual(index.resources('db.example.com'),
+                         [('rds', self.db)])
+        self.assertEqual(index.resources('mail.example.com'), [])
+        self.assertEqual(index.records('elb', self.elb), [self.records[0]])
+        self.assertEqual(index.records('rds', self.db), [self.records[1]])
+        index.refresh('rds')
+        self.assertEqual(len(self.listed), 4)
+        self.assertRaises(ValueError, index.refresh, 'cloudfront')
+
+    def test_errors(self):
+        index = EndpointIndex(services=['elb', 'rds'])
+        error = ValueError('AccessDenied')
+
+        def denied():
+            raise error
+        endpoints.SERVICES['rds'] = (denied, endpoints._db_instance_endpoints)
+        index.refresh()
+        self.assertEqual(index.errors, {'rds': error})
+        self.assertEqual(index.resources('www.example.com'),
+                         [('elb', self.elb)])
+        self.assertEqual(index.resources('db.example.com'),
+                         [('rds', self.db)])
+        endpoints.SERVICES['rds'] = (self.lister([]),
+                                     endpoints._db_instance_endpoints)
+        index.refresh('rds')
+        self.assertEqual(index.errors, {})
+        self.assertEqual(index.resources('db.example.com'), [])
+
+    def test_normalize_endpoint(self):
+        self.assertEqual(normalize_endpoint('DualStack.A.example.com.'),
+                         'a.example.com')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,11 @@
 ''' Tools for interacting with ElasticSearch Service '''
 
+from functools import partial
 from . import utils
 
+# describe_elasticsearch_domains accepts at most this many names per call
+MAX_DESCRIBE_DOMAINS = 5
+
 
 class Domains(utils.CollectionBase):
     ''' Get Elasticsearch service domains '''
@@ -9,18 +13,25 @@ class Domains(utils.CollectionBase):
     CONNECTION_TYPE = 'client'
     SERVICE = 'es'
 
-    def __init__(self, domain_names=None):
-        ''' Filter ES domains based on kwargs '''
-        self._kwargs = {}
-        if domain_names:
-            self._kwargs['DomainNames'] = utils.str_to_list(domain_names)
-        else:
-            self._kwargs['DomainNames'] = [
-                i['DomainName']
-                for i in self.get_connection().list_domain_names()['DomainNames']
-            ]
+    def __init__(self, domain_names=None, max_workers=4):
+        ''' Filter ES domains based on kwargs.
+            Without domain_names all domains are listed when iterated. '''
+        self._domain_names = utils.str_to_list(domain_names)
+        self._max_workers = max_workers
 
     def _all(self):
-        ''' Return a generator that yields ES domains '''
+        ''' Return a generator that yields ES domains, described in
+            concurrent requests of up to MAX_DESCRIBE_DOMAINS names '''
+        names = self._domain_names or [
+            i['DomainName']
+            for i in self.get_connection().list_domain_names()['DomainNames']
+        ]
+        return utils.iter_concurrently(
+            [partial(self._describe, chunk)
+             for chunk in utils.chunks(names, MAX_DESCRIBE_DOMAINS)],
+            max_workers=self._max_workers, ordered=False)
+
+    def _describe(self, names):
+        ''' Return the domain status of up to MAX_DESCRIBE_DOMAINS names '''
         return self.get_connection().describe_elasticsearch_domains(
-            **self._kwargs)['DomainStatusList']
+            DomainNames=names)['DomainStatusList']
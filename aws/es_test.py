@@ -0,0 +1,53 @@
+import threading
+import unittest
+import utils
+from es import Domains
+
+
+class FakeES(object):
+    ''' list_domain_names and describe_elasticsearch_domains over names '''
+
+    def __init__(self, names):
+        self.names = names
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def list_domain_names(self):
+        with self._lock:
+            self.calls.append('list')
+        return {'DomainNames': [{'DomainName': name} for name in self.names]}
+
+    def describe_elasticsearch_domains(self, DomainNames):
+        with self._lock:
+            self.calls.append(DomainNames)
+        return {'DomainStatusList': [{'DomainName': name}
+                                     for name in DomainNames]}
+
+
+class DomainsTestCase(unittest.TestCase):
+    ''' Test aws.es.Domains batching '''
+
+    def setUp(self):
+        self.names = ['domain-{}'.format(i) for i in range(12)]
+        self.fake = FakeES(self.names)
+        utils._connections[('es', 'client', None, None, None)] = self.fake
+
+    def tearDown(self):
+        utils._connections.clear()
+
+    def test_batches(self):
+        domains = Domains(max_workers=2)
+        self.assertEqual(self.fake.calls, [])
+        self.assertEqual(sorted(d['DomainName'] for d in domains),
+                         sorted(self.names))
+        self.assertEqual(self.fake.calls[0], 'list')
+        self.assertEqual(sorted(len(names) for names in self.fake.calls[1:]),
+                         [2, 5, 5])
+
+    def test_domain_names(self):
+        self.assertEqual(len(list(Domains(domain_names=self.names[:7]))), 7)
+        self.assertNotIn('list', self.fake.calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
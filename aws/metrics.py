@@ -0,0 +1,151 @@
+''' In-process metrics for AWS API calls and collections
+
+Metrics aggregates the events the library sends to utils observers:
+
+    connection:      service, connection_type, seconds
+    api_call:        service, operation, seconds, bytes, error
+    failed_attempt:  service, operation, attempts, error, throttled
+    items:           collection, service, count
+    filter:          path, scanned, matched
+    cache:           service, hit
+    change_batch:    zone_id, changes, seconds
+'''
+
+import bisect
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from . import utils
+
+
+class Histogram(object):
+    ''' Latency histogram with fixed buckets, in seconds '''
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        ''' Record a value '''
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        ''' Return the upper bound of the bucket holding the percentile '''
+        if not self.count:
+            return None
+        rank = self.count * percent / 100.0
+        seen = 0
+        for bound, count in zip(self.BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        ''' Return a summary of the histogram '''
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else None,
+                'max': self.max,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99)}
+
+
+class Metrics(object):
+    ''' Aggregate library events into counters and latency histograms
+
+    Counters and histograms are keyed by 'service.operation' for API
+    calls, by service for connections and caches, by collection for
+    items, by JMESPath path for filters and by zone for change batches.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        ''' Clear all recorded metrics '''
+        with self._lock:
+            self.counters = defaultdict(Counter)
+            self.latencies = defaultdict(Histogram)
+
+    def __call__(self, event, **fields):
+        ''' Record an event, see the module docstring for fields '''
+        with self._lock:
+            getattr(self, '_' + event, lambda **fields: None)(**fields)
+
+    def report(self):
+        ''' Return all metrics as a dictionary '''
+        with self._lock:
+            report = {}
+            for key, counter in self.counters.items():
+                report[key] = dict(counter)
+            for key, histogram in self.latencies.items():
+                report.setdefault(key, {})['latency'] = histogram.as_dict()
+            # the last failed attempt of a failed call is not retried
+            for values in report.values():
+                if 'failed_attempts' in values:
+                    values['retries'] = \
+                        values['failed_attempts'] - values.get('errors', 0)
+            return report
+
+    def _connection(self, service, connection_type, seconds):
+        key = 'connection.{}'.format(service)
+        self.counters[key]['created'] += 1
+        self.latencies[key].add(seconds)
+
+    def _api_call(self, service, operation, seconds, bytes, error):
+        key = '{}.{}'.format(service, operation)
+        counter = self.counters[key]
+        counter['calls'] += 1
+        counter['bytes'] += bytes
+        if error:
+            counter['errors'] += 1
+        self.latencies[key].add(seconds)
+
+    def _failed_attempt(self, service, operation, attempts, error, throttled):
+        counter = self.counters['{}.{}'.format(service, operation)]
+        counter['failed_attempts'] += 1
+        if throttled:
+            counter['throttled'] += 1
+
+    def _items(self, collection, service, count):
+        counter = self.counters['collection.{}.{}'.format(service, collection)]
+        counter['iterations'] += 1
+        counter['items'] += count
+
+    def _filter(self, path, scanned, matched):
+        counter = self.counters['filter.{}'.format(path)]
+        counter['pages'] += 1
+        counter['scanned'] += scanned
+        counter['matched'] += matched
+        counter['filtered'] += scanned - matched
+
+    def _cache(self, service, hit):
+        self.counters['cache.{}'.format(service)][
+            'hits' if hit else 'misses'] += 1
+
+    def _change_batch(self, zone_id, changes, seconds):
+        key = 'change_batch.{}'.format(zone_id)
+        self.counters[key]['batches'] += 1
+        self.counters[key]['changes'] += changes
+        self.latencies[key].add(seconds)
+
+
+@contextmanager
+def measure(metrics=None):
+    ''' Collect events into metrics (a new Metrics by default) for the
+        duration of a with block. Events from every thread are counted. '''
+    metrics = Metrics() if metrics is None else metrics
+    utils.add_observer(metrics)
+    try:
+        yield metrics
+    finally:
+        utils.remove_observer(metrics)
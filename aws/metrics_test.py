@@ -0,0 +1,49 @@
+import unittest
+import utils
+from metrics import Histogram, Metrics, measure
+
+
+class HistogramTestCase(unittest.TestCase):
+    ''' Test aws.metrics.Histogram percentiles '''
+
+    def test_percentiles(self):
+        histogram = Histogram()
+        for value in [0.001] * 90 + [0.3] * 9 + [7]:
+            histogram.add(value)
+        self.assertEqual(histogram.percentile(50), 0.005)
+        self.assertEqual(histogram.percentile(99), 0.5)
+        self.assertEqual(histogram.percentile(100), 7)
+        self.assertEqual(histogram.as_dict()['count'], 100)
+        self.assertIsNone(Histogram().percentile(50))
+
+
+class MetricsTestCase(unittest.TestCase):
+    ''' Test aws.metrics.Metrics aggregation of utils events '''
+
+    def test_measure(self):
+        with measure() as metrics:
+            utils.notify('failed_attempt', service='ec2',
+                         operation='DescribeInstances', attempts=1,
+                         error='Throttling', throttled=True)
+            utils.notify('api_call', service='ec2',
+                         operation='DescribeInstances', seconds=0.2,
+                         bytes=100, error=None)
+            utils.notify('filter', path='Reservations', scanned=10,
+                         matched=3)
+            utils.notify('unknown', value=1)
+        utils.notify('cache', service='ec2', hit=True)
+        report = metrics.report()
+        calls = report['ec2.DescribeInstances']
+        self.assertEqual(calls['calls'], 1)
+        self.assertEqual(calls['retries'], 1)
+        self.assertEqual(calls['throttled'], 1)
+        self.assertEqual(calls['latency']['count'], 1)
+        self.assertEqual(report['filter.Reservations']['filtered'], 7)
+        self.assertNotIn('cache.ec2', report)
+        metrics.reset()
+        self.assertEqual(metrics.report(), {})
+        self.assertIsInstance(metrics, Metrics)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,8 +8,9 @@ class Instances(utils.CollectionBase):
     ''' Get RDS instances
 
     Builds a list of RDS instances. Calling with no arguments
-    returns all RDS instances. Since boto3 does not provide a service
-    resource or collection object for RDS, this function uses JMESPath
+    returns all RDS instances. Identifiers and engines are filtered
+    by the API; since boto3 does not provide a service resource or
+    collection object for RDS, the remaining arguments use JMESPath
     queries for filtering.
 
     Args:
@@ -28,13 +29,11 @@ class Instances(utils.CollectionBase):
 
     def __init__(self, ids=None, engines=None, classes=None, status=None):
         ''' Filter RDS instances based on kwargs '''
+        self._ids = ids
+        self._collection_filter = utils.CollectionFilter()
         self._jmes_filter = utils.ProjectionFilter()
-        if ids:
-            self._jmes_filter.add_aggregate('DBInstanceIdentifier',
-                                            utils.str_to_list(ids))
         if engines:
-            self._jmes_filter.add_filter('Engine',
-                                         utils.str_to_list(engines))
+            self._collection_filter.append('engine', engines)
         if classes:
             self._jmes_filter.add_filter('DBInstanceClass',
                                          utils.str_to_list(classes))
@@ -43,19 +42,26 @@ class Instances(utils.CollectionBase):
                                          utils.str_to_list(status))
 
     def _all(self):
-        ''' Return a generator that yields RDS instance dictionaries '''
-        return self.get_connection().get_paginator(
-            'describe_db_instances').paginate().search(
-                'DBInstances[{}]'.format(self._jmes_filter))
+        ''' Generator function that yields RDS instance dictionaries '''
+        paginator = self.get_connection().get_paginator(
+            'describe_db_instances')
+        for filters in utils.plan_filters(self._collection_filter.filters,
+                                          'db-instance-id', self._ids):
+            instances = self._jmes_filter.search(
+                self.read_ahead(paginator.paginate(**_filter_kwargs(filters))),
+                'DBInstances')
+            for instance in instances:
+                yield instance
 
 
 class Snapshots(utils.CollectionBase):
     ''' Get RDS snapshots
 
     Builds a list of RDS snapshots. Calling with no arguments
-    returns all RDS snapshots. Since boto3 does not provide a service
-    resource or collection object for RDS, this function uses
-    JMESPath queries for filtering.
+    returns all RDS snapshots. Instance and snapshot identifiers are
+    filtered by the API; since boto3 does not provide a service
+    resource or collection object for RDS, statuses use JMESPath
+    queries for filtering.
 
     Args:
         instance_ids (Optional[list]):
@@ -76,13 +82,9 @@ class Snapshots(utils.CollectionBase):
                  status=None):
         ''' Filter RDS snapshots based on kwargs '''
         self._kwargs = {}
+        self._instance_ids = instance_ids
+        self._snapshot_ids = snapshot_ids
         self._jmes_filter = utils.ProjectionFilter()
-        if instance_ids:
-            self._jmes_filter.add_aggregate('DBInstanceIdentifier',
-                                            utils.str_to_list(instance_ids))
-        if snapshot_ids:
-            self._jmes_filter.add_aggregate('DBSnapshotIdentifier',
-                                            utils.str_to_list(snapshot_ids))
         if status:
             self._jmes_filter.add_filter('Status',
                                          utils.str_to_list(status))
@@ -90,16 +92,46 @@ class Snapshots(utils.CollectionBase):
             self._kwargs['SnapshotType'] = snapshot_type
 
     def _all(self):
-        ''' Return a generator that yields RDS snapshots '''
-        return self.get_connection().get_paginator(
-            'describe_db_snapshots').paginate(**self._kwargs).search(
-                'DBSnapshots[{}]'.format(self._jmes_filter))
-
-    def latest(self):
-        ''' Return the most recent snapshot '''
+        ''' Generator function that yields RDS snapshots '''
+        paginator = self.get_connection().get_paginator(
+            'describe_db_snapshots')
+        # snapshots matching either identifier list are returned, so each
+        # list is looked up separately and duplicates are skipped
+        plans = []
+        if self._snapshot_ids:
+            plans += utils.plan_filters([], 'db-snapshot-id',
+                                        self._snapshot_ids)
+        if self._instance_ids:
+            plans += utils.plan_filters([], 'db-instance-id',
+                                        self._instance_ids)
+        seen = set()
+        for filters in plans or [[]]:
+            snapshots = self._jmes_filter.search(
+                self.read_ahead(paginator.paginate(
+                    **dict(self._kwargs, **_filter_kwargs(filters)))),
+                'DBSnapshots')
+            for snapshot in snapshots:
+                if self._snapshot_ids and self._instance_ids:
+                    if snapshot['DBSnapshotIdentifier'] in seen:
+                        continue
+                    seen.add(snapshot['DBSnapshotIdentifier'])
+                yield snapshot
+
+    def latest(self, n=None):
+        ''' Return the most recent snapshot,
+            or a list of the n most recent, newest first '''
+        return utils.select(self._available(),
+                            itemgetter('SnapshotCreateTime'), n)
+
+    def oldest(self, n=None):
+        ''' Return the oldest snapshot, or a list of the n oldest '''
+        return utils.select(self._available(),
+                            itemgetter('SnapshotCreateTime'), n, largest=False)
+
+    def _available(self):
+        ''' Generator function that yields available snapshots '''
         # avoid snapshots that are currently being created
-        available_snaps = [snap for snap in self._all() if snap['Status'] == 'available']
-        return sorted(available_snaps, key=itemgetter('SnapshotCreateTime'))[-1]
+        return (snap for snap in self._all() if snap['Status'] == 'available')
 
 
 class SecurityGroups(utils.CollectionBase):
@@ -116,6 +148,12 @@ class SecurityGroups(utils.CollectionBase):
 
     def _all(self):
         ''' Return a generator that yields RDS security group dictionaries '''
-        return self.get_connection().get_paginator(
-            'describe_db_security_groups').paginate().search(
-                'DBSecurityGroups[{}]'.format(self._jmes_filter))
+        return self._jmes_filter.search(
+            self.get_connection().get_paginator(
+                'describe_db_security_groups').paginate(),
+            'DBSecurityGroups')
+
+
+def _filter_kwargs(filters):
+    ''' Return API kwargs for a list of server-side filters '''
+    return {'Filters': filters} if filters else {}
@@ -0,0 +1,71 @@
+import unittest
+import utils
+from rds import Instances, Snapshots
+
+
+class FakeRDS(object):
+    ''' describe_db_instances and describe_db_snapshots applying the
+        db-instance-id and db-snapshot-id filters '''
+
+    instances = [{'DBInstanceIdentifier': 'db1', 'Engine': 'mysql'},
+                 {'DBInstanceIdentifier': 'db2', 'Engine': 'postgres'}]
+    snapshots = [{'DBSnapshotIdentifier': 's1', 'DBInstanceIdentifier': 'db1',
+                  'Status': 'available'},
+                 {'DBSnapshotIdentifier': 's2', 'DBInstanceIdentifier': 'db2',
+                  'Status': 'available'},
+                 {'DBSnapshotIdentifier': 's3', 'DBInstanceIdentifier': 'db1',
+                  'Status': 'available'}]
+    keys = {'db-instance-id': 'DBInstanceIdentifier',
+            'db-snapshot-id': 'DBSnapshotIdentifier',
+            'engine': 'Engine'}
+
+    def __init__(self):
+        self.calls = []
+
+    def get_paginator(self, operation):
+        self.operation = operation
+        return self
+
+    def paginate(self, **kwargs):
+        self.calls.append(kwargs)
+        items = self.instances if self.operation == 'describe_db_instances' \
+            else self.snapshots
+        for f in kwargs.get('Filters', []):
+            items = [i for i in items if i[self.keys[f['Name']]] in f['Values']]
+        key = 'DBInstances' if self.operation == 'describe_db_instances' \
+            else 'DBSnapshots'
+        return [{key: items}]
+
+
+class RdsTestCase(unittest.TestCase):
+    ''' Test aws.rds filters pushed down to the API '''
+
+    def setUp(self):
+        self.fake = FakeRDS()
+        utils._connections[('rds', 'client', None, None, None)] = self.fake
+
+    def tearDown(self):
+        utils._connections.clear()
+
+    def test_instance_filters(self):
+        ids = ['db{}'.format(i) for i in range(150)]
+        instances = list(Instances(ids=ids, engines='mysql'))
+        self.assertEqual([i['DBInstanceIdentifier'] for i in instances],
+                         ['db1'])
+        self.assertEqual(len(self.fake.calls), 2)
+        for call, chunk in zip(self.fake.calls, (ids[:100], ids[100:])):
+            self.assertEqual(call['Filters'], [
+                {'Name': 'engine', 'Values': ['mysql']},
+                {'Name': 'db-instance-id', 'Values': chunk}])
+
+    def test_snapshots_deduplicated(self):
+        snapshots = Snapshots(snapshot_ids=['s1', 's2'], instance_ids='db1')
+        self.assertEqual([s['DBSnapshotIdentifier'] for s in snapshots],
+                         ['s1', 's2', 's3'])
+        self.assertEqual([call['Filters'][0]['Name']
+                          for call in self.fake.calls],
+                         ['db-snapshot-id', 'db-instance-id'])
+
+
+if __name__ == '__main__':
+    unittest.main()
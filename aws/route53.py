@@ -1,8 +1,27 @@
 ''' Tools for interacting with AWS Route53 '''
 
+import hashlib
 import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from . import utils
 
+# ChangeBatch limits; UPSERT changes count twice towards both
+MAX_BATCH_RECORDS = 1000
+MAX_BATCH_VALUE_CHARS = 32000
+
+# seconds before the process-wide zone index is rebuilt
+ZONE_INDEX_TTL = 300
+
+_zone_index = None
+_zone_index_built = 0
+_zone_index_lock = threading.Lock()
+
 
 class Zones(utils.CollectionBase):
     ''' Get Hosted Zones '''
@@ -19,9 +38,10 @@ class Zones(utils.CollectionBase):
 
     def _all(self):
         ''' Return a generator that yields hosted zone dictionaries '''
-        return self.get_connection().get_paginator(
-            'list_hosted_zones').paginate().search(
-                "HostedZones[{}]".format(self._jmes_filter))
+        return self._jmes_filter.search(
+            self.read_ahead(self.get_connection().get_paginator(
+                'list_hosted_zones').paginate()),
+            'HostedZones')
 
 
 class Records(utils.CollectionBase):
@@ -30,9 +50,20 @@ class Records(utils.CollectionBase):
     CONNECTION_TYPE = 'client'
     SERVICE = 'route53'
 
-    def __init__(self, names=None, domains=None, types=None):
-        ''' Filter DNS records based on kwargs '''
+    def __init__(self, names=None, domains=None, types=None,
+                 max_workers=None, ordered=True, zone_ids=None):
+        ''' Filter DNS records based on kwargs.
+
+            zone_ids selects hosted zones by id instead of by domain.
+            Set max_workers to scan hosted zones concurrently. With
+            ordered=False records are yielded as they arrive rather
+            than zone by zone.
+        '''
         self._domains = domains
+        self._zone_ids = utils.str_to_list(zone_ids)
+        self._max_workers = max_workers
+        self._ordered = ordered
+        self._backoff = utils.AdaptiveBackoff('route53')
         self._jmes_filter = utils.ProjectionFilter()
         if names:
             self._jmes_filter.add_aggregate('Name', normalize_dnsnames(names))
@@ -41,28 +72,162 @@ class Records(utils.CollectionBase):
 
     def _all(self):
         ''' Generator function that yields DNS records '''
-        for zone in Zones(self._domains):
-            records = self.get_connection().get_paginator(
-                'list_resource_record_sets'
-            ).paginate(
-                HostedZoneId=zone['Id']
-            ).search(
-                "ResourceRecordSets[{}]".format(self._jmes_filter)
-            )
-            for record in records:
+        zone_ids = self._zone_ids or [
+            zone['Id'] for zone in Zones(self._domains)]
+        if not self._max_workers or self._max_workers < 2:
+            for zone_id in zone_ids:
+                for record in self._zone_records(zone_id):
+                    yield record
+            return
+        records = utils.iter_concurrently(
+            [partial(self._zone_records, zone_id) for zone_id in zone_ids],
+            max_workers=self._max_workers, ordered=self._ordered)
+        for record in records:
+            yield record
+
+    def _zone_records(self, zone_id):
+        ''' Generator function that yields the DNS records of one zone '''
+        kwargs = {'HostedZoneId': zone_id}
+        while True:
+            page = self._backoff.call(
+                self.get_connection().list_resource_record_sets, **kwargs)
+            for record in self._jmes_filter.search([page],
+                                                   'ResourceRecordSets'):
                 yield record
+            if not page['IsTruncated']:
+                return
+            kwargs['StartRecordName'] = page['NextRecordName']
+            for key in ('NextRecordType', 'NextRecordIdentifier'):
+                if key in page:
+                    kwargs['Start' + key[4:]] = page[key]
+
+
+class ZoneIndex(object):
+    ''' In-memory index for resolving DNS names to hosted zones
+
+        Zones are stored in a trie of reversed labels, so a name resolves
+        to the zone with the longest matching suffix in O(labels).
+        Private zones only match lookups for a VPC they are associated
+        with, which lets public and private zones share a name.
+    '''
+
+    def __init__(self, zones=None):
+        self._root = {}
+        self._vpcs = {}
+        for zone in Zones() if zones is None else zones:
+            self.add(zone)
+
+    def add(self, zone):
+        ''' Add a hosted zone dictionary to the index '''
+        node = self._root
+        for label in _reversed_labels(zone['Name']):
+            node = node.setdefault(label, {})
+        # None can never be a label, so it holds the zones of the node
+        node.setdefault(None, []).append(zone)
+
+    def get_zone(self, fqdn, vpc_id=None):
+        ''' Return the hosted zone dictionary for fqdn
+
+            With vpc_id the closest private zone associated with the VPC
+            wins, otherwise the closest public zone does. Each falls back
+            to the other kind if nothing matches.
+        '''
+        best = fallback = None
+        node = self._root
+        for label in _reversed_labels(fqdn):
+            node = node.get(label)
+            if node is None:
+                break
+            for zone in node.get(None, []):
+                private = zone.get('Config', {}).get('PrivateZone', False)
+                if vpc_id is None and not private or \
+                        private and self._associated(zone, vpc_id):
+                    best = zone
+                elif vpc_id is None or not private:
+                    fallback = zone
+        zone = best or fallback
+        if zone is None:
+            raise ValueError('no hosted zone found for {}'.format(fqdn))
+        return zone
+
+    def get_zone_id(self, fqdn, vpc_id=None):
+        ''' Return the hosted zone ID for fqdn '''
+        return self.get_zone(fqdn, vpc_id)['Id']
+
+    def _associated(self, zone, vpc_id):
+        ''' Check if private zone is associated with vpc_id '''
+        if vpc_id is None:
+            return False
+        # VPC associations are only fetched for private zones on a lookup
+        if zone['Id'] not in self._vpcs:
+            vpcs = utils.get_connection('client', 'route53').get_hosted_zone(
+                Id=zone['Id']).get('VPCs', [])
+            self._vpcs[zone['Id']] = set(vpc['VPCId'] for vpc in vpcs)
+        return vpc_id in self._vpcs[zone['Id']]
+
+
+class QuietLog(object):
+    ''' Change log sink that discards changes '''
+
+    def write_zone(self, zone_id, changes):
+        ''' Write the changes of one zone '''
+        pass
+
+
+class NdjsonLog(object):
+    ''' Change log sink that streams one compact JSON object per change '''
+
+    def __init__(self, stream=None):
+        self._stream = stream
+
+    def write_zone(self, zone_id, changes):
+        ''' Write the changes of one zone, tagged with the zone id '''
+        stream = self._stream or sys.stdout
+        for change in changes:
+            stream.write(json.dumps(dict(change, HostedZoneId=zone_id),
+                                    separators=(',', ':')))
+            stream.write('\n')
+
+
+class PrettyLog(object):
+    ''' Change log sink that writes an indented JSON array per zone '''
+
+    def __init__(self, stream=None):
+        self._stream = stream
+
+    def write_zone(self, zone_id, changes):
+        ''' Write the changes of one zone, one change at a time '''
+        stream = self._stream or sys.stdout
+        stream.write('[')
+        empty = True
+        for change in changes:
+            stream.write('\n  ' if empty else ',\n  ')
+            stream.write(json.dumps(change, sort_keys=True, indent=2,
+                                    separators=(',', ': '))
+                         .replace('\n', '\n  '))
+            empty = False
+        stream.write(']\n' if empty else '\n]\n')
 
 
 class ChangeRecords(object):
-    ''' Object for creating change batches to modify Route53 configuration '''
+    ''' Object for creating change batches to modify Route53 configuration
 
-    def __init__(self):
+        Records are matched to hosted zones through a ZoneIndex that is
+        built on first use. Pass vpc_id to target private zones.
+        Committed changes are written to log, a change log sink
+        (QuietLog, NdjsonLog or PrettyLog, the default).
+    '''
+
+    def __init__(self, zone_index=None, vpc_id=None, log=None):
         self._change_dict = {}
+        self._zone_index = zone_index
+        self._vpc_id = vpc_id
+        self._log = PrettyLog() if log is None else log
 
     def create(self, name, value, record_type, ttl=300):
         '''add UPSERT(create or update) to change batch'''
 
-        zone_id = get_zone_id_from_fqdn(name)
+        zone_id = self._get_zone_id(name)
         self._update_change_dict(zone_id)
         self._change_dict[zone_id]['changes'].append({
             'Action': 'UPSERT', 'ResourceRecordSet': {
@@ -77,12 +242,36 @@ class ChangeRecords(object):
     def delete(self, name):
         '''add DELETE to change batch'''
 
-        zone_id = get_zone_id_from_fqdn(name)
+        zone_id = self._get_zone_id(name)
         self._update_change_dict(zone_id)
         self._change_dict[zone_id]['deletes'].append(name)
 
-    def commit(self, dry_run=False):
-        '''commit all changes'''
+    def add(self, action, record_set, zone_id=None):
+        '''add a change of any action for a complete ResourceRecordSet'''
+
+        zone_id = zone_id or self._get_zone_id(record_set['Name'])
+        self._update_change_dict(zone_id)
+        self._change_dict[zone_id]['changes'].append({
+            'Action': action, 'ResourceRecordSet': record_set})
+
+    def commit(self, dry_run=False, wait=False, max_workers=4,
+               timeout=600):
+        '''commit all changes
+
+        Changes are packed into batches within the Route53 request limits.
+        Zones are submitted concurrently and batches within a zone in order.
+        With wait=True all submitted changes are polled until INSYNC or
+        until timeout seconds pass; TimedOut is set on the reports of
+        changes still pending. Returns a report dictionary per batch.
+
+        A failing zone stops its own remaining batches only. Its exception
+        is stored in errors, keyed by zone id, the reports of all batches
+        that were submitted are kept in reports, and the first error is
+        raised once every zone is done.
+        '''
+        self.errors = {}
+        self.reports = []
+        zones = []
         for zone in self._change_dict.items():
             zone_id = zone[0]
             changes = zone[1]['changes']
@@ -90,23 +279,50 @@ class ChangeRecords(object):
 
             # check if deletes list has items
             if deletes:
-                # add deletes to change batch
-                changes += [{'Action': 'DELETE', 'ResourceRecordSet': rec}
-                            for rec in Records(deletes)]
+                # deletes go first to make way for records replacing them
+                changes = [
+                    {'Action': 'DELETE', 'ResourceRecordSet': rec}
+                    for rec in find_records(zone_id, deletes)] + changes
 
             # check if changes list has items
             if changes:
                 # output changes
-                print json.dumps(changes, sort_keys=True,
-                                 indent=2, separators=(',', ': '))
-                if not dry_run:
-                    # process changes per zone in batches of 50
-                    for batch in utils.grouper(changes, 50):
-                        utils.get_connection('client', 'route53').change_resource_record_sets(
-                            HostedZoneId=zone_id,
-                            # use filter to strip NoneType items from batches
-                            ChangeBatch={'Changes': filter(None, batch)}
-                        )
+                self._log.write_zone(zone_id, changes)
+                zones.append((zone_id, changes))
+
+        if dry_run or not zones:
+            return []
+        backoff = utils.AdaptiveBackoff('route53')
+        # each zone reports into its own list as batches are submitted,
+        # so the batches of a failing zone that were applied are kept
+        zone_reports = [[] for _ in zones]
+        error = None
+        executor = ThreadPoolExecutor(max_workers)
+        try:
+            futures = [executor.submit(_submit_changes, zone_id, changes,
+                                       backoff, reports)
+                       for (zone_id, changes), reports
+                       in zip(zones, zone_reports)]
+            for (zone_id, _), future in zip(zones, futures):
+                exception, traceback = future.exception_info()
+                if exception is not None:
+                    self.errors[zone_id] = exception
+                    error = error or (exception, traceback)
+        finally:
+            executor.shutdown()
+        self.reports = [report for reports in zone_reports
+                        for report in reports]
+        if error:
+            raise type(error[0]), error[0], error[1]
+        if wait:
+            _wait_for_changes(self.reports, timeout, backoff)
+        return self.reports
+
+    def _get_zone_id(self, name):
+        '''Return the hosted zone id for name'''
+        if self._zone_index is None:
+            self._zone_index = ZoneIndex()
+        return self._zone_index.get_zone_id(name, self._vpc_id)
 
     def _update_change_dict(self, zone_id):
         '''Build dictionary of records using zone_id as the key'''
@@ -114,16 +330,284 @@ class ChangeRecords(object):
             self._change_dict[zone_id] = {'changes': [],
                                           'deletes': []}
 
+    def dump(self, stream):
+        '''write staged changes to stream as JSON, chunk by chunk'''
+        json.dump(self._change_dict, stream, separators=(',', ':'))
+
     def __str__(self):
         return json.dumps(self._change_dict, sort_keys=True,
                           indent=2, separators=(',', ': '))
 
 
-def get_zone_id_from_fqdn(fqdn):
-    ''' Strip domain and get hosted zone id '''
-    return list(Zones(
-        '.'.join(normalize_dnsnames(fqdn).split('.')[-3:])
-    ))[0]['Id']
+class ZoneSync(object):
+    ''' Reconcile hosted zones with desired record sets
+
+    Current records of a zone are loaded into an index keyed by (name,
+    type, set identifier) and compared with the desired record sets, so
+    only records that differ are UPSERTed. With prune=True records that
+    are not desired are DELETEd, except the zone's apex SOA and NS.
+
+    A fingerprint of each zone's desired records is kept after a
+    successful sync, and syncing the same records again skips the zone
+    without listing it. Pass path to persist fingerprints between runs.
+    Zones changed outside the reconciler are only corrected with force.
+    '''
+
+    def __init__(self, prune=False, path=None, zone_index=None,
+                 vpc_id=None, log=None):
+        self._prune = prune
+        self._path = path
+        self._zone_index = zone_index
+        self._vpc_id = vpc_id
+        self._log = log
+        self._fingerprints = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self._fingerprints = json.load(f)
+
+    def sync(self, zone_name, records, force=False, dry_run=False,
+             **kwargs):
+        '''Submit the changes that make a zone match records, a list of
+        ResourceRecordSet dictionaries, and return those changes.
+        kwargs are passed to ChangeRecords.commit.'''
+        if self._zone_index is None:
+            self._zone_index = ZoneIndex()
+        zone = self._zone_index.get_zone(zone_name, self._vpc_id)
+        records = list(records)
+        fingerprint = hashlib.sha1(json.dumps([self._prune] + sorted(
+            json.dumps(_normalize_record_set(record), sort_keys=True)
+            for record in records))).hexdigest()
+        if not force and self._fingerprints.get(zone['Id']) == fingerprint:
+            return []
+
+        diff = diff_record_sets(Records(zone_ids=zone['Id']), records,
+                                zone['Name'] if self._prune else None)
+        changes = ChangeRecords(zone_index=self._zone_index,
+                                vpc_id=self._vpc_id, log=self._log)
+        for change in diff:
+            changes.add(change['Action'], change['ResourceRecordSet'],
+                        zone['Id'])
+        changes.commit(dry_run=dry_run, **kwargs)
+
+        if not dry_run:
+            self._fingerprints[zone['Id']] = fingerprint
+            if self._path:
+                with open(self._path, 'w') as f:
+                    json.dump(self._fingerprints, f)
+        return diff
+
+
+def diff_record_sets(current, desired, prune_zone=None):
+    ''' Return the changes that turn the current record sets into the
+        desired ones. Unwanted records are only deleted when prune_zone
+        is set to the zone name, whose apex SOA and NS are kept. '''
+    current = dict((_record_set_key(record), record) for record in current)
+    desired = dict((_record_set_key(record), record) for record in desired)
+    changes = []
+    # deletes come first so a name can change type, e.g. CNAME to A
+    if prune_zone:
+        apex = _record_set_key({'Name': prune_zone, 'Type': None})[0]
+        for key, record in current.items():
+            if key in desired or key[0] == apex and key[1] in ('SOA', 'NS'):
+                continue
+            changes.append({'Action': 'DELETE', 'ResourceRecordSet': record})
+    for key, record in desired.items():
+        if key not in current or _normalize_record_set(record) != \
+                _normalize_record_set(current[key]):
+            changes.append({'Action': 'UPSERT', 'ResourceRecordSet': record})
+    return changes
+
+
+def _record_set_key(record):
+    ''' Return the (name, type, set identifier) key of a record set '''
+    return (normalize_dnsnames(record['Name']).lower().replace('*', '\\052'),
+            record['Type'], record.get('SetIdentifier'))
+
+
+def _normalize_record_set(record):
+    ''' Return a record set in a form that compares equal to the
+        same record set as returned by Route53 '''
+    record = dict(record)
+    record['Name'] = _record_set_key(record)[0]
+    if 'ResourceRecords' in record:
+        record['ResourceRecords'] = sorted(
+            value['Value'] for value in record['ResourceRecords'])
+    if 'AliasTarget' in record:
+        alias = dict(record['AliasTarget'])
+        alias['DNSName'] = normalize_dnsnames(alias['DNSName']).lower()
+        record['AliasTarget'] = alias
+    return record
+
+
+def pack_changes(changes, max_records=MAX_BATCH_RECORDS,
+                 max_chars=MAX_BATCH_VALUE_CHARS):
+    ''' Generator function that yields lists of changes within the
+        ChangeBatch limits on records and value characters
+
+        The changes of one record name are kept together and in order,
+        in one batch unless they exceed the limits by themselves, so a
+        DELETE is applied with the record that replaces it.
+    '''
+    names = OrderedDict()
+    for change in changes:
+        name = normalize_dnsnames(change['ResourceRecordSet']['Name'])
+        names.setdefault(name.lower().replace('*', '\\052'),
+                         []).append(change)
+    batch = []
+    records = chars = 0
+    for group in names.values():
+        sizes = [_change_size(change) for change in group]
+        group_records = sum(size[0] for size in sizes)
+        group_chars = sum(size[1] for size in sizes)
+        if group_records <= max_records and group_chars <= max_chars:
+            units = [(group, group_records, group_chars)]
+        else:
+            units = [([change], size[0], size[1])
+                     for change, size in zip(group, sizes)]
+        for unit, unit_records, unit_chars in units:
+            if batch and (records + unit_records > max_records or
+                          chars + unit_chars > max_chars):
+                yield batch
+                batch = []
+                records = chars = 0
+            batch.extend(unit)
+            records += unit_records
+            chars += unit_chars
+    if batch:
+        yield batch
+
+
+def _change_size(change):
+    ''' Return the (records, value characters) a change counts against
+        the ChangeBatch limits '''
+    values = [record['Value'] for record in
+              change['ResourceRecordSet'].get('ResourceRecords', [])]
+    multiplier = 2 if change['Action'] == 'UPSERT' else 1
+    # alias records have no values but still count as one record
+    return (multiplier * max(len(values), 1),
+            multiplier * sum(len(value) for value in values))
+
+
+def _submit_changes(zone_id, changes, backoff, reports):
+    ''' Submit the changes of one zone in order, one batch at a time,
+        appending a report for each batch to reports '''
+    connection = utils.get_connection('client', 'route53')
+    for batch in pack_changes(changes):
+        start = time.time()
+        change_info = backoff.call(
+            connection.change_resource_record_sets,
+            HostedZoneId=zone_id, ChangeBatch={'Changes': batch}
+        )['ChangeInfo']
+        reports.append({'ZoneId': zone_id,
+                        'ChangeId': change_info['Id'],
+                        'Status': change_info['Status'],
+                        'Changes': len(batch),
+                        'SubmitTime': start,
+                        'SubmitLatency': time.time() - start})
+        utils.notify('change_batch', zone_id=zone_id, changes=len(batch),
+                     seconds=reports[-1]['SubmitLatency'])
+
+
+def _wait_for_changes(reports, timeout, backoff, interval=5):
+    ''' Poll the changes in reports until all are INSYNC or timeout
+        seconds pass, recording each change's time to sync and whether
+        it timed out '''
+    connection = utils.get_connection('client', 'route53')
+    deadline = time.time() + timeout
+    for report in reports:
+        report['TimedOut'] = False
+    pending = [report for report in reports if report['Status'] != 'INSYNC']
+    while pending and time.time() < deadline:
+        time.sleep(interval)
+        for report in pending:
+            report['Status'] = backoff.call(
+                connection.get_change,
+                Id=report['ChangeId'])['ChangeInfo']['Status']
+            if report['Status'] == 'INSYNC':
+                report['SyncLatency'] = time.time() - report['SubmitTime']
+        pending = [report for report in pending
+                   if report['Status'] != 'INSYNC']
+    for report in pending:
+        report['TimedOut'] = True
+
+
+def get_zone_index(ttl=ZONE_INDEX_TTL):
+    ''' Return the process-wide ZoneIndex, rebuilding it after ttl seconds '''
+    global _zone_index, _zone_index_built
+    with _zone_index_lock:
+        if _zone_index is None or time.time() - _zone_index_built > ttl:
+            _zone_index = ZoneIndex()
+            _zone_index_built = time.time()
+        return _zone_index
+
+
+def get_zone_id_from_fqdn(fqdn, vpc_id=None):
+    ''' Get the id of the closest hosted zone containing fqdn '''
+    return get_zone_index().get_zone_id(fqdn, vpc_id)
+
+
+def _reversed_labels(name):
+    ''' Return the lowercased labels of a DNS name, top level first '''
+    return reversed(normalize_dnsnames(name).lower().split('.')[:-1])
+
+
+def find_records(zone_id, names):
+    ''' Generator function that yields the DNS records of names in a zone
+
+        Names are visited in Route53 sort order. Each lookup starts at the
+        record name with StartRecordName, and a fetched page is reused for
+        any following names it covers, so the zone is swept at most once.
+    '''
+    connection = utils.get_connection('client', 'route53')
+    response = start_key = None
+    names = normalize_dnsnames(utils.str_to_list(names))
+    for name in sorted(set(names), key=_record_sort_key):
+        key = _record_sort_key(name)
+        targeted = response is None or \
+            not _page_covers(response, start_key, key)
+        if targeted:
+            response = connection.list_resource_record_sets(
+                HostedZoneId=zone_id, StartRecordName=name)
+            start_key = key
+        records = _records_named(response, key)
+        if not records and not targeted:
+            # only trust a miss on a page that started at this name
+            response = connection.list_resource_record_sets(
+                HostedZoneId=zone_id, StartRecordName=name)
+            start_key = key
+            records = _records_named(response, key)
+        for record in records:
+            yield record
+        # records of one name can continue on the next page
+        while response['IsTruncated'] and \
+                _record_sort_key(response['NextRecordName']) == key:
+            kwargs = {'HostedZoneId': zone_id,
+                      'StartRecordName': response['NextRecordName']}
+            for next_key in ('NextRecordType', 'NextRecordIdentifier'):
+                if next_key in response:
+                    kwargs['Start' + next_key[4:]] = response[next_key]
+            response = connection.list_resource_record_sets(**kwargs)
+            for record in _records_named(response, key):
+                yield record
+
+
+def _page_covers(response, start_key, key):
+    ''' Check if a list_resource_record_sets page spans the name key '''
+    if key < start_key:
+        return False
+    return not response['IsTruncated'] or \
+        key < _record_sort_key(response['NextRecordName'])
+
+
+def _records_named(response, key):
+    ''' Return the records of a page whose name sorts as key '''
+    return [record for record in response['ResourceRecordSets']
+            if _record_sort_key(record['Name']) == key]
+
+
+def _record_sort_key(name):
+    ''' Sort key approximating Route53 record order (reversed labels) '''
+    return tuple(_reversed_labels(name.replace('*', '\\052')))
 
 
 def normalize_dnsnames(items):
@@ -0,0 +1,262 @@
+import json
+import unittest
+import utils
+from botocore.exceptions import ClientError
+from StringIO import StringIO
+from route53 import (ZoneIndex, find_records, pack_changes, PrettyLog,
+                     NdjsonLog, QuietLog, ChangeRecords, Records,
+                     diff_record_sets)
+
+
+class ZoneIndexTestCase(unittest.TestCase):
+    ''' Test aws.route53.ZoneIndex lookups '''
+
+    def setUp(self):
+        self.index = ZoneIndex([
+            {'Id': 'public', 'Name': 'example.com.',
+             'Config': {'PrivateZone': False}},
+            {'Id': 'sub', 'Name': 'deep.sub.example.com.',
+             'Config': {'PrivateZone': False}},
+            {'Id': 'private', 'Name': 'example.com.',
+             'Config': {'PrivateZone': True}},
+        ])
+        # avoid get_hosted_zone calls for VPC associations
+        self.index._vpcs['private'] = set(['vpc-1'])
+
+    def test_longest_suffix(self):
+        self.assertEqual(self.index.get_zone_id('example.com'), 'public')
+        self.assertEqual(self.index.get_zone_id('www.Example.com.'), 'public')
+        self.assertEqual(self.index.get_zone_id('a.deep.sub.example.com'),
+                         'sub')
+        self.assertEqual(self.index.get_zone_id('sub.example.com'), 'public')
+        self.assertRaises(ValueError, self.index.get_zone_id, 'example.org')
+
+    def test_private_zones(self):
+        self.assertEqual(self.index.get_zone_id('www.example.com', 'vpc-1'),
+                         'private')
+        self.assertEqual(self.index.get_zone_id('www.example.com', 'vpc-2'),
+                         'public')
+
+class FakeRoute53(object):
+    ''' list_resource_record_sets over a sorted list of records '''
+
+    def __init__(self, names, page_size=2):
+        self.records = [{'Name': name, 'Type': 'A'} for name in names]
+        self.page_size = page_size
+        self.calls = 0
+
+    def list_resource_record_sets(self, HostedZoneId, StartRecordName,
+                                  StartRecordType=None):
+        self.calls += 1
+        start = [r['Name'] for r in self.records].index(StartRecordName) \
+            if StartRecordName in [r['Name'] for r in self.records] else \
+            len(self.records)
+        page = self.records[start:start + self.page_size]
+        response = {'ResourceRecordSets': page, 'IsTruncated': False}
+        if start + self.page_size < len(self.records):
+            response['IsTruncated'] = True
+            response['NextRecordName'] = \
+                self.records[start + self.page_size]['Name']
+            response['NextRecordType'] = 'A'
+        return response
+
+
+class FakeThrottled(object):
+    ''' list_resource_record_sets that is always throttled '''
+
+    def __init__(self):
+        self.calls = {}
+
+    def list_resource_record_sets(self, HostedZoneId, **kwargs):
+        self.calls[HostedZoneId] = self.calls.get(HostedZoneId, 0) + 1
+        raise ClientError({'Error': {'Code': 'Throttling'}},
+                          'ListResourceRecordSets')
+
+
+class RecordsTestCase(unittest.TestCase):
+    ''' Test aws.route53.Records retries against the retry budget '''
+
+    def setUp(self):
+        self.fake = FakeThrottled()
+        utils._connections[('route53', 'client', None, None, None)] = \
+            self.fake
+
+    def tearDown(self):
+        utils.reset()
+
+    def test_exhausted_budget(self):
+        budget = utils.get_rate_limiter('route53', 'us-east-1').budget
+        budget._balance = 0
+        budget.per_second = 0
+        records = Records(zone_ids=['a', 'b', 'c'], max_workers=3)
+        self.assertRaises(ClientError, list, records)
+        # zones may be cancelled by the first error, but none is retried
+        self.assertTrue(self.fake.calls)
+        self.assertLessEqual(max(self.fake.calls.values()), 1)
+
+
+class FindRecordsTestCase(unittest.TestCase):
+    ''' Test aws.route53.find_records page reuse '''
+
+    def setUp(self):
+        self.fake = FakeRoute53(['a.example.com.', 'b.example.com.',
+                                 'c.example.com.', 'd.example.com.'])
+        utils._connections[('route53', 'client', None, None, None)] = \
+            self.fake
+
+    def tearDown(self):
+        utils._connections.clear()
+
+    def test_find_records(self):
+        names = [r['Name'] for r in find_records(
+            'zone', ['b.example.com', 'a.example.com', 'd.example.com'])]
+        self.assertEqual(names, ['a.example.com.', 'b.example.com.',
+                                 'd.example.com.'])
+        self.assertEqual(self.fake.calls, 2)
+        names = [r['Name'] for r in find_records('zone', 'c.example.com')]
+        self.assertEqual(names, ['c.example.com.'])
+
+class PackChangesTestCase(unittest.TestCase):
+    ''' Test aws.route53.pack_changes batch limits '''
+
+    def change(self, action, value):
+        return {'Action': action, 'ResourceRecordSet': {
+            'Name': 'a.example.com.', 'Type': 'TXT',
+            'ResourceRecords': [{'Value': value}]}}
+
+    def test_record_limit(self):
+        changes = [self.change('UPSERT', 'x')] * 5
+        self.assertEqual([len(b) for b in pack_changes(changes, 4, 100)],
+                         [2, 2, 1])
+
+    def test_value_limit(self):
+        changes = [self.change('DELETE', 'x' * 40)] * 5
+        self.assertEqual([len(b) for b in pack_changes(changes, 100, 100)],
+                         [2, 2, 1])
+
+class FakeChanges(object):
+    ''' change_resource_record_sets failing on the second batch of 'bad' '''
+
+    def __init__(self):
+        self.batches = {}
+
+    def change_resource_record_sets(self, HostedZoneId, ChangeBatch):
+        count = self.batches[HostedZoneId] = \
+            self.batches.get(HostedZoneId, 0) + 1
+        if HostedZoneId == 'bad' and count == 2:
+            raise ValueError('rejected')
+        return {'ChangeInfo': {'Id': '{}-{}'.format(HostedZoneId, count),
+                               'Status': 'PENDING'}}
+
+    def get_change(self, Id):
+        return {'ChangeInfo': {'Id': Id, 'Status': 'PENDING'}}
+
+
+class CommitTestCase(unittest.TestCase):
+    ''' Test aws.route53.ChangeRecords.commit errors and reports '''
+
+    def setUp(self):
+        utils._connections[('route53', 'client', None, None, None)] = \
+            FakeChanges()
+
+    def tearDown(self):
+        utils._connections.clear()
+
+    def changes(self, zones, count):
+        changes = ChangeRecords(log=QuietLog())
+        for zone_id in zones:
+            for i in range(count):
+                changes.add('CREATE', {'Name': '{}.example.com.'.format(i),
+                                       'Type': 'A', 'ResourceRecords': [
+                                           {'Value': '192.0.2.1'}]},
+                            zone_id)
+        return changes
+
+    def test_zone_error(self):
+        changes = self.changes(['good', 'bad'], 1500)
+        self.assertRaises(ValueError, changes.commit)
+        self.assertEqual(changes.errors.keys(), ['bad'])
+        self.assertEqual(sorted(r['ChangeId'] for r in changes.reports),
+                         ['bad-1', 'good-1', 'good-2'])
+
+    def test_wait_timeout(self):
+        changes = self.changes(['good'], 1)
+        reports = changes.commit(wait=True, timeout=0)
+        self.assertEqual([r['TimedOut'] for r in reports], [True])
+
+
+class ChangeLogTestCase(unittest.TestCase):
+    ''' Test aws.route53 change log sinks '''
+
+    changes = [{'Action': 'UPSERT', 'ResourceRecordSet': {'Name': 'a.'}},
+               {'Action': 'DELETE', 'ResourceRecordSet': {'Name': 'b.'}}]
+
+    def test_pretty(self):
+        for changes in (self.changes, []):
+            stream = StringIO()
+            PrettyLog(stream).write_zone('zone', iter(changes))
+            self.assertEqual(stream.getvalue(), json.dumps(
+                changes, sort_keys=True, indent=2,
+                separators=(',', ': ')) + '\n')
+
+    def test_ndjson(self):
+        stream = StringIO()
+        NdjsonLog(stream).write_zone('zone', self.changes)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[1])['HostedZoneId'], 'zone')
+
+class DiffRecordSetsTestCase(unittest.TestCase):
+    ''' Test aws.route53.diff_record_sets '''
+
+    current = [
+        {'Name': 'example.com.', 'Type': 'NS', 'TTL': 172800,
+         'ResourceRecords': [{'Value': 'ns-1.'}]},
+        {'Name': 'a.example.com.', 'Type': 'A', 'TTL': 300,
+         'ResourceRecords': [{'Value': '10.0.0.2'}, {'Value': '10.0.0.1'}]},
+        {'Name': '\\052.example.com.', 'Type': 'CNAME', 'TTL': 300,
+         'ResourceRecords': [{'Value': 'a.example.com'}]},
+        {'Name': 'old.example.com.', 'Type': 'A', 'TTL': 300,
+         'ResourceRecords': [{'Value': '10.0.0.3'}]},
+    ]
+
+    def test_unchanged(self):
+        desired = [
+            {'Name': 'A.example.com', 'Type': 'A', 'TTL': 300,
+             'ResourceRecords': [{'Value': '10.0.0.1'},
+                                 {'Value': '10.0.0.2'}]},
+            {'Name': '*.example.com', 'Type': 'CNAME', 'TTL': 300,
+             'ResourceRecords': [{'Value': 'a.example.com'}]}]
+        self.assertEqual(diff_record_sets(self.current, desired), [])
+        changes = diff_record_sets(self.current, desired, 'example.com')
+        self.assertEqual(
+            [(c['Action'], c['ResourceRecordSet']['Name']) for c in changes],
+            [('DELETE', 'old.example.com.')])
+
+    def test_changed(self):
+        desired = [{'Name': 'a.example.com', 'Type': 'A', 'TTL': 60,
+                    'ResourceRecords': [{'Value': '10.0.0.1'}]}]
+        self.assertEqual(diff_record_sets(self.current, desired),
+                         [{'Action': 'UPSERT',
+                           'ResourceRecordSet': desired[0]}])
+
+    def test_cname_to_a(self):
+        desired = self.current[:2] + [
+            {'Name': '*.example.com.', 'Type': 'A', 'TTL': 300,
+             'ResourceRecords': [{'Value': '10.0.0.4'}]},
+            {'Name': 'new.example.com.', 'Type': 'A', 'TTL': 300,
+             'ResourceRecords': [{'Value': '10.0.0.5'}]}]
+        changes = diff_record_sets(self.current, desired, 'example.com')
+        # the CNAME must be deleted before the A record replaces it,
+        # in the same batch
+        batches = [[(c['Action'], c['ResourceRecordSet']['Name'],
+                     c['ResourceRecordSet']['Type']) for c in batch]
+                   for batch in pack_changes(changes, 4, 1000)]
+        pair = [('DELETE', '\\052.example.com.', 'CNAME'),
+                ('UPSERT', '*.example.com.', 'A')]
+        self.assertTrue(any(batch[i:i + 2] == pair for batch in batches
+                            for i in range(len(batch))))
+        self.assertEqual(sum(len(batch) for batch in batches), 4)
+
+if __name__ == '__main__':
+    unittest.main()
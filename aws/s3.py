@@ -1,14 +1,118 @@
 ''' Tools for interacting with S3 '''
 
+import threading
+from botocore.exceptions import ClientError
+from functools import partial
 from . import utils
 
+# attribute: (client method, response key or None for the whole response,
+#             error code meaning the attribute is not configured)
+ATTRIBUTES = {
+    'Tagging': ('get_bucket_tagging', 'TagSet', 'NoSuchTagSet'),
+    'Versioning': ('get_bucket_versioning', None, None),
+    'Encryption': ('get_bucket_encryption',
+                   'ServerSideEncryptionConfiguration',
+                   'ServerSideEncryptionConfigurationNotFoundError'),
+    'Lifecycle': ('get_bucket_lifecycle_configuration', 'Rules',
+                  'NoSuchLifecycleConfiguration'),
+}
+
+_bucket_regions = {}
+_bucket_regions_lock = threading.Lock()
+
 
 class Buckets(utils.CollectionBase):
-    ''' Get S3 buckets '''
+    ''' Get S3 buckets
+
+    Yields boto3 Bucket resources, or with fields (see utils.Projection)
+    lightweight records built from the raw list_buckets response.
+
+    With attributes (keys of ATTRIBUTES) the list_buckets dictionaries
+    are enriched with their Region and the attributes requested, by up
+    to max_workers threads. Each bucket's region is resolved once (see
+    get_bucket_region) and its metadata calls go to the shared client
+    of that region. Buckets deleted while enriching are skipped.
+    fields may then select attributes too.
+    '''
 
     CONNECTION_TYPE = 'resource'
     SERVICE = 's3'
 
+    def __init__(self, fields=None, attributes=None, max_workers=10):
+        ''' Select record fields and bucket attributes based on kwargs '''
+        self._projection = utils.Projection(fields) if fields else None
+        self._attributes = utils.str_to_list(attributes) or []
+        self._max_workers = max_workers
+        unknown = set(self._attributes) - set(ATTRIBUTES)
+        if unknown:
+            raise ValueError('unknown bucket attributes: {}'.format(
+                ', '.join(sorted(unknown))))
+
     def _all(self):
         ''' Return a collection of S3 buckets '''
+        if self._attributes:
+            return self._enriched()
+        if self._projection:
+            return self._projection.search(
+                [self.get_connection().meta.client.list_buckets()],
+                'Buckets[]')
         return self.get_connection().buckets.all()
+
+    def _enriched(self):
+        ''' Generator function that yields enriched bucket dictionaries '''
+        buckets = utils.iter_concurrently(
+            [partial(self._enrich, bucket) for bucket in
+             self.get_connection().meta.client.list_buckets()['Buckets']],
+            max_workers=self._max_workers, ordered=False)
+        for bucket in buckets:
+            yield self._projection(bucket) if self._projection else bucket
+
+    def _enrich(self, bucket):
+        ''' Generator function that yields bucket with its region and
+            attributes, or nothing if it no longer exists '''
+        try:
+            bucket['Region'] = get_bucket_region(
+                bucket['Name'], self.get_connection().meta.client)
+            client = self.get_connection(bucket['Region']).meta.client
+            for attribute in self._attributes:
+                method, key, missing = ATTRIBUTES[attribute]
+                try:
+                    response = getattr(client, method)(Bucket=bucket['Name'])
+                except ClientError as e:
+                    if e.response['Error']['Code'] != missing:
+                        raise
+                    bucket[attribute] = None
+                    continue
+                response.pop('ResponseMetadata', None)
+                bucket[attribute] = response.get(key) if key else response
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'NoSuchBucket':
+                raise
+            return
+        yield bucket
+
+
+def get_bucket_region(name, client=None):
+    ''' Return the region of bucket name
+
+        Regions are memoized for the process and stored in the inventory
+        cache when one is enabled, so each bucket is located once.
+    '''
+    with _bucket_regions_lock:
+        if name in _bucket_regions:
+            return _bucket_regions[name]
+    cache = utils.get_cache()
+    key = 's3.bucket_region:{}'.format(name)
+    region = cache.get('s3', key) if cache else None
+    if region is None:
+        client = client or utils.get_connection('client', 's3')
+        location = client.get_bucket_location(
+            Bucket=name)['LocationConstraint']
+        # buckets in us-east-1 have no constraint, old eu-west-1 ones EU
+        region = {None: 'us-east-1', '': 'us-east-1',
+                  'EU': 'eu-west-1'}.get(location, location)
+        if cache:
+            cache.set('s3', key, region)
+    with _bucket_regions_lock:
+        _bucket_regions[name] = region
+    return region
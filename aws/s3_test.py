@@ -0,0 +1,80 @@
+import unittest
+import s3
+import utils
+from botocore.exceptions import ClientError
+from s3 import Buckets
+
+
+class FakeS3(object):
+    ''' S3 resource whose client serves buckets of several regions '''
+
+    def __init__(self, region, regions, calls):
+        self.meta = self
+        self.client = self
+        self.buckets = self
+        self.region = region
+        self.regions = regions
+        self.calls = calls
+
+    def list_buckets(self):
+        return {'Buckets': [{'Name': name} for name in sorted(self.regions)]}
+
+    def all(self):
+        return iter(sorted(self.regions))
+
+    def get_bucket_location(self, Bucket):
+        self.calls.append(('location', Bucket))
+        return {'LocationConstraint': self.regions[Bucket]}
+
+    def get_bucket_tagging(self, Bucket):
+        self.calls.append((self.region, Bucket))
+        if Bucket == 'gone':
+            raise ClientError({'Error': {'Code': 'NoSuchBucket'}}, 'Tagging')
+        if Bucket == 'untagged':
+            raise ClientError({'Error': {'Code': 'NoSuchTagSet'}}, 'Tagging')
+        return {'TagSet': [{'Key': 'region', 'Value': self.region}],
+                'ResponseMetadata': {}}
+
+
+class BucketsTestCase(unittest.TestCase):
+    ''' Test aws.s3.Buckets enrichment '''
+
+    def setUp(self):
+        self.calls = []
+        regions = {'logs': None, 'eu': 'EU', 'west': 'us-west-2',
+                   'gone': 'us-west-2', 'untagged': None}
+        for region in (None, 'us-east-1', 'eu-west-1', 'us-west-2'):
+            utils._connections[('s3', 'resource', region, None, None)] = \
+                FakeS3(region or 'default', regions, self.calls)
+
+    def tearDown(self):
+        utils._connections.clear()
+        s3._bucket_regions.clear()
+
+    def test_enrich(self):
+        buckets = Buckets(attributes=['Tagging'], fields=['Name', 'Region',
+                                                          'Tagging'])
+        records = sorted(buckets)
+        self.assertEqual([record.Name for record in records],
+                         ['eu', 'logs', 'untagged', 'west'])
+        self.assertEqual(records[0].Region, 'eu-west-1')
+        self.assertEqual(records[0].Tagging[0]['Value'], 'eu-west-1')
+        self.assertIsNone(records[2].Tagging)
+        list(buckets)
+        # regions are resolved once per bucket
+        self.assertEqual(len([call for call in self.calls
+                              if call[0] == 'location']), 5)
+
+    def test_plain(self):
+        self.assertEqual(list(Buckets()),
+                         ['eu', 'gone', 'logs', 'untagged', 'west'])
+        self.assertEqual([record.Name for record in Buckets(fields='Name')],
+                         ['eu', 'gone', 'logs', 'untagged', 'west'])
+        self.assertEqual(self.calls, [])
+
+    def test_unknown_attribute(self):
+        self.assertRaises(ValueError, Buckets, attributes='Acl')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,24 +1,322 @@
 ''' Utilities for AWS library '''
 
+import Queue
+import heapq
+import json
+import random
+import re
+import sys
+import threading
+import time
 import boto3
-from itertools import izip_longest
+import botocore.session
+import jmespath
+from botocore.config import Config
+from botocore.credentials import RefreshableCredentials
+from botocore.exceptions import ClientError
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice, izip_longest
+
+# size of the urllib3 connection pool behind each shared client
+MAX_POOL_CONNECTIONS = 10
+
+# filters with more values per key than this are matched with sets
+SET_FILTER_THRESHOLD = 20
+MAX_CACHED_EXPRESSIONS = 512
+
+# values per server-side filter when lookups are split into chunks
+MAX_FILTER_VALUES = 100
+
+# error codes AWS APIs use to signal request throttling
+THROTTLING_ERRORS = ('Throttling', 'ThrottlingException',
+                     'PriorRequestNotComplete', 'RequestLimitExceeded',
+                     'TooManyRequestsException')
+
+# session name used when assuming roles for fan-out iteration
+ROLE_SESSION_NAME = 'fabboto'
+
+# targets iterated at once across all fan-outs in the process
+MAX_CONCURRENT_TARGETS = 32
+
+# API requests per second each (service, region) starts at, near the
+# documented limits so unthrottled calls are not slowed; the rates
+# adapt to throttling between MIN_RATE and MAX_RATE
+MIN_RATE = 0.5
+MAX_RATE = 1000
+DEFAULT_RATE = 100
+SERVICE_RATES = {'route53': 5, 's3': MAX_RATE}
+# services with one endpoint for all regions, paced by a single limiter
+GLOBAL_SERVICES = ('cloudfront', 'iam', 'route53')
+
+# retries allowed per request, per second regardless of requests, and
+# at most in reserve, for each (service, region)
+RETRY_RATIO = 0.1
+RETRIES_PER_SECOND = 1
+MAX_RETRIES_IN_RESERVE = 20
+
+_lock = threading.RLock()
+_sessions = {}
+_connections = {}
+_account_ids = {}
+_expressions = {}
+_cache = None
+_context = threading.local()
+_observers = []
+_limiters = {}
+_creation_locks = {}
+_target_slots = threading.BoundedSemaphore(MAX_CONCURRENT_TARGETS)
+
+# where a fanned out item came from
+Origin = namedtuple('Origin', 'region account')
+Target = namedtuple('Target', 'region profile role_arn')
 
 
 class CollectionBase(object):
     ''' Mixin class for AWS service classes '''
+
+    # pages fetched ahead of the consumer by paginated collections; with
+    # the default of 1 every paginated iteration starts a background
+    # thread, set 0 to page in the consumer's thread instead
+    PREFETCH_PAGES = 1
+
     def __iter__(self):
         ''' Generic generator function that yields
             AWS resources using _all() method '''
-        for i in self._all():
+        return self._iter(refresh=False)
+
+    def refresh(self):
+        ''' Generator function that yields AWS resources from the API,
+            bypassing and then replacing any cached results '''
+        return self._iter(refresh=True)
+
+    def _iter(self, refresh):
+        ''' Yield from _all(), counting items for observers '''
+        count = 0
+        try:
+            for i in self._iter_cached(refresh):
+                count += 1
+                yield i
+        finally:
+            if _observers:
+                notify('items', collection=type(self).__name__,
+                       service=self.SERVICE, count=count)
+
+    def _iter_cached(self, refresh):
+        ''' Yield from _all(), through the inventory cache if enabled.
+            Only client collections are cached; resources do not pickle. '''
+        cache = _cache
+        if cache is None or self.CONNECTION_TYPE != 'client':
+            for i in self._all():
+                yield i
+            return
+        key = self._cache_key()
+        items = None if refresh else cache.get(self.SERVICE, key)
+        if _observers:
+            notify('cache', service=self.SERVICE, hit=items is not None)
+        if items is None:
+            items = []
+            for i in self._all():
+                items.append(i)
+                yield i
+            # only complete results are stored
+            cache.set(self.SERVICE, key, items)
+            return
+        for i in items:
             yield i
 
-    def get_connection(self):
-        ''' Return an AWS connection object '''
-        return get_connection(self.CONNECTION_TYPE, self.SERVICE)
+    def _cache_key(self):
+        ''' Return the cache key for this collection's results '''
+        return json.dumps([type(self).__module__, type(self).__name__] +
+                          list(self.origin()) + [_normalize(vars(self))])
+
+    def read_ahead(self, pages):
+        ''' Return pages fetched PREFETCH_PAGES ahead of the consumer '''
+        return read_ahead(pages, self.PREFETCH_PAGES)
+
+    def to_columns(self, fields, types=None, table=None):
+        ''' Stream the collection into a columns.ColumnTable, or append
+            it to table. See ColumnTable for fields and types. '''
+        from . import columns
+        if table is None:
+            table = columns.ColumnTable(fields, types)
+        return table.extend(self)
+
+    def iter_futures(self, batch_size=100, prefetch=1):
+        ''' Return a FutureIterator over the collection for event loops '''
+        return FutureIterator(self, batch_size, prefetch)
+
+    def across(self, regions=None, role_arns=None, profile=None,
+               max_workers=10):
+        ''' Return a FanOut iterating this collection in every combination
+            of regions and assumed roles '''
+        return FanOut(self, regions, role_arns, profile, max_workers)
+
+    def origin(self):
+        ''' Return the Origin (region, account) the collection lists '''
+        target = getattr(_context, 'target', None) or Target(None, None, None)
+        connection = self.get_connection()
+        if self.CONNECTION_TYPE == 'resource':
+            connection = connection.meta.client
+        region = connection.meta.region_name
+        if target.role_arn:
+            return Origin(region, target.role_arn.split(':')[4])
+        return Origin(region, get_account_id(target.profile))
+
+    def get_connection(self, region=None, profile=None):
+        ''' Return an AWS connection object
+
+            Inside a FanOut the region, profile and role of the current
+            target are used unless region or profile are given.
+        '''
+        target = getattr(_context, 'target', None) or Target(None, None, None)
+        return get_connection(self.CONNECTION_TYPE, self.SERVICE,
+                              region=region or target.region,
+                              profile=profile or target.profile,
+                              role_arn=target.role_arn)
+
+
+class FanOut(object):
+    ''' Iterate a collection across regions and accounts concurrently
+
+    Yields (origin, item) pairs, where origin is an Origin namedtuple of
+    the region and account the item came from. Targets are iterated by
+    up to max_workers threads, and by at most MAX_CONCURRENT_TARGETS
+    across the process. A failing target does not stop the others; its
+    exception is stored in errors, keyed by Target.
+
+    Args:
+        collection (CollectionBase):
+            the collection to iterate
+        regions (Optional[list]):
+            region names. Default: the session's region
+        role_arns (Optional[list]):
+            IAM roles to assume, one per account. Default: no role
+        profile (Optional[str]):
+            profile used directly or to assume roles. Default: None
+        max_workers (Optional[int]):
+            targets iterated at once. Default: 10
+    '''
+
+    def __init__(self, collection, regions=None, role_arns=None,
+                 profile=None, max_workers=10):
+        self._collection = collection
+        self._targets = [Target(region, profile, role_arn)
+                         for region in str_to_list(regions) or [None]
+                         for role_arn in str_to_list(role_arns) or [None]]
+        self._max_workers = max_workers
+        self.errors = {}
+
+    def __iter__(self):
+        return iter_concurrently(
+            [partial(self._target_items, target) for target in self._targets],
+            max_workers=self._max_workers, ordered=False)
+
+    def _target_items(self, target):
+        ''' Generator function that yields the (origin, item) pairs
+            of one target, recording its error instead of raising it '''
+        with _target_slots:
+            _context.target = target
+            try:
+                origin = self._collection.origin()
+                for item in self._collection._iter(refresh=False):
+                    yield origin, item
+            except Exception as e:
+                self.errors[target] = e
+            finally:
+                _context.target = None
+
+
+class FutureIterator(object):
+    ''' Non-blocking, batched iteration for event loop integration
+
+    next_batch() returns a concurrent.futures.Future that resolves to the
+    next list of up to batch_size items, or to an empty list once the
+    iterable is exhausted. Up to prefetch further batches are fetched
+    ahead, so the next page is in flight while the caller consumes the
+    current one. An asyncio loop can await a batch with
+    asyncio.wrap_future(iterator.next_batch()).
+    '''
+
+    def __init__(self, iterable, batch_size=100, prefetch=1):
+        self._items = iter(iterable)
+        self._batch_size = batch_size
+        self._prefetch = prefetch
+        self._pending = deque()
+        self._closed = False
+        # a single worker keeps batches in order over the shared iterator
+        self._executor = ThreadPoolExecutor(1)
+
+    def next_batch(self):
+        ''' Return a Future of the next batch of items '''
+        if self._closed:
+            raise ValueError('FutureIterator is closed')
+        while len(self._pending) <= self._prefetch:
+            self._pending.append(self._executor.submit(self._fetch))
+        return self._pending.popleft()
+
+    def close(self):
+        ''' Cancel prefetched batches and close the underlying iterable '''
+        if self._closed:
+            return
+        self._closed = True
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        close = getattr(self._items, 'close', None)
+        if close:
+            self._executor.submit(close)
+        self._executor.shutdown(wait=False)
+
+    def _fetch(self):
+        ''' Return the next batch of items '''
+        return list(islice(self._items, self._batch_size))
+
+
+class Projection(object):
+    ''' Build lightweight records from raw API items
+
+        fields is a list of JMESPath expressions, or a dictionary of
+        record attribute to expression. Listed fields become attributes
+        with every run of non-identifier characters replaced by an
+        underscore, so Placement.AvailabilityZone is read as
+        record.Placement_AvailabilityZone and Tags[0].Value as
+        record.Tags_0_Value. Use the dictionary form to name fields
+        that would clash. Records are namedtuples, which carry no
+        per-instance dictionary.
+    '''
+
+    def __init__(self, fields):
+        if not isinstance(fields, dict):
+            fields = OrderedDict(
+                (re.sub(r'\W+', '_', field).strip('_'), field)
+                for field in str_to_list(fields))
+        self.record = namedtuple('Record', fields.keys())
+        self._getters = [_field_getter(field) for field in fields.values()]
+
+    def __call__(self, item):
+        ''' Return the record for a raw API item '''
+        return self.record._make(getter(item) for getter in self._getters)
+
+    def search(self, pages, path):
+        ''' Generator function that yields a record for every item
+            selected by the JMESPath expression path in each page '''
+        expression = compile_expression(path)
+        for page in pages:
+            for item in expression.search(page) or []:
+                yield self(item)
 
 
 class ProjectionFilter(object):
-    ''' JMESPath projection based filtering '''
+    ''' JMESPath projection based filtering
+
+        Aggregates are OR'd together, filters are AND'd with each other
+        and with the aggregates. Compiled expressions are cached by their
+        canonical (sorted) form, and filters with more than
+        SET_FILTER_THRESHOLD values per key are matched with set lookups
+        instead of chained == clauses.
+    '''
 
     def __init__(self):
         self._aggregates = {}
@@ -32,33 +330,61 @@ class ProjectionFilter(object):
         ''' add filters to JMESPath filter projection '''
         self._filters[key] = str_to_list(values)
 
+    def compile(self, path):
+        ''' Return the compiled expression selecting matching items
+            from the list at path '''
+        return compile_expression('{}[{}]'.format(path, self))
+
+    def search(self, pages, path):
+        ''' Generator function that yields the matching items
+            of the list at path in each page '''
+        if not self._uses_sets():
+            expression = self.compile(path)
+            for page in pages:
+                items = expression.search(page) or []
+                if _observers:
+                    notify('filter', path=path, matched=len(items),
+                           scanned=len(compile_expression(
+                               '{}[]'.format(path)).search(page) or []))
+                for item in items:
+                    yield item
+            return
+        aggregates = [(key, frozenset(values))
+                      for key, values in self._aggregates.items()]
+        filters = [(key, frozenset(values))
+                   for key, values in self._filters.items()]
+        expression = compile_expression('{}[]'.format(path))
+        for page in pages:
+            scanned = expression.search(page) or []
+            matched = 0
+            for item in scanned:
+                if aggregates and not any(item.get(key) in values
+                                          for key, values in aggregates):
+                    continue
+                if all(item.get(key) in values for key, values in filters):
+                    matched += 1
+                    yield item
+            if _observers:
+                notify('filter', path=path, matched=matched,
+                       scanned=len(scanned))
+
+    def _uses_sets(self):
+        ''' Check if any key has too many values for == clauses '''
+        return any(len(values) > SET_FILTER_THRESHOLD
+                   for values in self._aggregates.values() +
+                   self._filters.values())
+
     def __str__(self):
         ''' Output the JMESPath filter projection as a string '''
-        query = ""
+        clauses = []
         if self._aggregates:
-            query += "?("
-            for key in self._aggregates.iterkeys():
-                for value in self._aggregates[key]:
-                    query += "{} == '{}' || ".format(key, value)
-            # slice off the trailing OR ' || '
-            query = query[:-4]
-            query += ")"
-        if self._filters:
-            if self._aggregates:
-                query += " && "
-            else:
-                query += "?"
-            for key in self._filters.iterkeys():
-                query += "("
-                for value in self._filters[key]:
-                    query += "{} == '{}' || ".format(key, value)
-                # slice off the trailing OR ' || '
-                query = query[:-4]
-                query += ") && "
-            # slice off the trailing AND ' && '
-            query = query[:-4]
-
-        return query
+            clauses.append(_or_clause(self._aggregates,
+                                      sorted(self._aggregates)))
+        for key in sorted(self._filters):
+            clauses.append(_or_clause(self._filters, [key]))
+        if not clauses:
+            return ''
+        return '?' + ' && '.join(clauses)
 
 
 class CollectionFilter(object):
@@ -82,17 +408,576 @@ class CollectionFilter(object):
             self.append(key, val)
 
 
-def get_connection(connection_type, service):
-    ''' Return an AWS connection object '''
-    if connection_type == 'resource':
-        return boto3.resource(service)
-    if connection_type == 'client':
-        return boto3.client(service)
+class RateLimiter(object):
+    ''' Token bucket pacing the API requests of one (service, region)
+
+        The rate adapts to throttling (AIMD): it grows by about one
+        request per second for every second of unthrottled requests and
+        halves on a throttling response, at most once per second so a
+        burst of throttled requests in flight counts once. Requests
+        that would retry draw from budget, a RetryBudget.
+    '''
+
+    def __init__(self, rate=DEFAULT_RATE, minimum=MIN_RATE,
+                 maximum=MAX_RATE):
+        self.rate = float(rate)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.budget = RetryBudget()
+        self._tokens = 1.0
+        self._updated = time.time()
+        self._decreased = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        ''' Wait for the next request slot '''
+        with self._lock:
+            now = time.time()
+            # up to a second of unused rate is kept as burst
+            self._tokens = min(max(self.rate, 1), self._tokens +
+                               (now - self._updated) * self.rate)
+            self._updated = now
+            # slots are reserved ahead, so waiters sleep without the lock
+            self._tokens -= 1
+            wait = -self._tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+    def success(self):
+        ''' Record an unthrottled request '''
+        with self._lock:
+            self.rate = min(self.maximum, self.rate + 1 / self.rate)
+        self.budget.deposit()
+
+    def throttled(self):
+        ''' Record a throttled request '''
+        with self._lock:
+            now = time.time()
+            if now - self._decreased >= 1:
+                self.rate = max(self.minimum, self.rate / 2)
+                self._decreased = now
+
+
+class RetryBudget(object):
+    ''' Retries allowed as a share of requests, so a throttled API gets
+        a few retries rather than a retry storm '''
+
+    def __init__(self, ratio=RETRY_RATIO, per_second=RETRIES_PER_SECOND,
+                 maximum=MAX_RETRIES_IN_RESERVE):
+        self.ratio = ratio
+        self.per_second = per_second
+        self.maximum = maximum
+        self._balance = float(maximum)
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        ''' Credit the budget for a request '''
+        with self._lock:
+            self._balance = min(self.maximum, self._balance + self.ratio)
+
+    def withdraw(self):
+        ''' Spend one retry, returning False when the budget is empty '''
+        with self._lock:
+            now = time.time()
+            self._balance = min(self.maximum, self._balance +
+                                (now - self._updated) * self.per_second)
+            self._updated = now
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+
+class AdaptiveBackoff(object):
+    ''' Retry throttled calls with a delay shared between threads.
+
+        The delay doubles on every throttling error and halves on every
+        successful call, so concurrent workers slow down together and
+        recover once the API stops throttling. Each retry draws from the
+        RetryBudget of (service, region), the one botocore retries of
+        its clients draw from, and the error is raised once it is empty.
+    '''
+
+    def __init__(self, service, region=None, base=0.1, maximum=20,
+                 retries=8):
+        self.service = service
+        self.region = region
+        self.base = base
+        self.maximum = maximum
+        self.retries = retries
+        self._delay = 0
+        self._lock = threading.Lock()
+
+    def call(self, func, *args, **kwargs):
+        ''' Call func, retrying on throttling errors '''
+        attempt = 0
+        while True:
+            if self._delay:
+                # jitter keeps concurrent workers from retrying in lockstep
+                time.sleep(self._delay * random.uniform(0.5, 1))
+            try:
+                result = func(*args, **kwargs)
+            except ClientError as e:
+                if not is_throttling_error(e) or attempt >= self.retries \
+                        or not get_rate_limiter(
+                            self.service, self.region).budget.withdraw():
+                    raise
+                attempt += 1
+                with self._lock:
+                    self._delay = min(self.maximum,
+                                      max(self.base, self._delay * 2))
+                continue
+            with self._lock:
+                self._delay = self._delay / 2 if self._delay > self.base else 0
+            return result
+
+
+def _or_clause(values, keys):
+    ''' Return a JMESPath clause matching any of the values of keys '''
+    return '({})'.format(' || '.join(
+        "{} == '{}'".format(key, value)
+        for key in keys for value in sorted(values[key])))
+
+
+def _field_getter(field):
+    ''' Return a function reading field from an API item dictionary '''
+    if field.replace('_', '').isalnum():
+        # plain keys skip the JMESPath interpreter
+        return lambda item: item.get(field)
+    return compile_expression(field).search
+
+
+def compile_expression(query):
+    ''' Return a compiled JMESPath expression, cached by query '''
+    expression = _expressions.get(query)
+    if expression is None:
+        if len(_expressions) >= MAX_CACHED_EXPRESSIONS:
+            _expressions.clear()
+        expression = _expressions[query] = jmespath.compile(query)
+    return expression
+
+
+def _normalize(value):
+    ''' Return a JSON serializable, canonical form of collection state '''
+    if isinstance(value, dict):
+        return sorted((key, _normalize(val)) for key, val in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [_normalize(val) for val in value]
+    if isinstance(value, ProjectionFilter):
+        return str(value)
+    if isinstance(value, CollectionFilter):
+        return _normalize(value.filters)
+    if value is None or isinstance(value, (basestring, int, long, float)):
+        return value
+    # runtime helpers such as backoff state do not affect results
+    return type(value).__name__
+
+
+def set_cache(cache):
+    ''' Set the inventory cache used by CollectionBase iteration '''
+    global _cache
+    _cache = cache
+
+
+def get_cache():
+    ''' Return the inventory cache, or None when caching is disabled '''
+    return _cache
+
+
+def get_session(profile=None, role_arn=None):
+    ''' Return the shared boto3 session for profile, or for role_arn
+        assumed with the credentials of profile '''
+    key = (profile, role_arn)
+    with _lock:
+        if key in _sessions:
+            return _sessions[key]
+    # roles are assumed outside _lock, so other lookups do not wait on STS
+    with _creation_lock(('session',) + key):
+        with _lock:
+            if key in _sessions:
+                return _sessions[key]
+        if role_arn:
+            session = _assume_role_session(profile, role_arn)
+        else:
+            with _lock:
+                session = boto3.Session(profile_name=profile)
+        with _lock:
+            _sessions[key] = session
+        return session
+
+
+def _creation_lock(key):
+    ''' Return the lock serializing the creation of the shared object key,
+        so concurrent callers wait for one creation without holding _lock '''
+    with _lock:
+        return _creation_locks.setdefault(key, threading.Lock())
+
+
+def _assume_role_session(profile, role_arn):
+    ''' Return a boto3 session whose credentials are refreshed by
+        assuming role_arn before they expire '''
+    sts = get_connection('client', 'sts', profile=profile)
+
+    def refresh():
+        credentials = sts.assume_role(
+            RoleArn=role_arn, RoleSessionName=ROLE_SESSION_NAME
+        )['Credentials']
+        return {'access_key': credentials['AccessKeyId'],
+                'secret_key': credentials['SecretAccessKey'],
+                'token': credentials['SessionToken'],
+                'expiry_time': credentials['Expiration'].isoformat()}
+
+    botocore_session = botocore.session.Session()
+    # botocore has no public setter for refreshable credentials
+    botocore_session._credentials = \
+        RefreshableCredentials.create_from_metadata(
+            metadata=refresh(), refresh_using=refresh,
+            method='sts-assume-role')
+    botocore_session.set_config_variable(
+        'region', get_session(profile).region_name)
+    return boto3.Session(botocore_session=botocore_session)
+
+
+def get_connection(connection_type, service, region=None, profile=None,
+                   role_arn=None):
+    ''' Return a shared AWS connection object
+
+        Connections are created once per (service, type, region, profile,
+        role_arn) and reused, so service models and credentials are only
+        loaded once. Clients are thread-safe, resources are not; avoid
+        sharing resource connections between threads. Requests of all
+        connections to a service in a region share one RateLimiter.
+    '''
+    key = (service, connection_type, region, profile, role_arn)
+    with _lock:
+        if key in _connections:
+            return _connections[key]
+    start = time.time()
+    session = get_session(profile, role_arn)
+    # boto3 sessions are not thread-safe, so creation happens under the lock
+    with _lock:
+        if key not in _connections:
+            config = Config(max_pool_connections=MAX_POOL_CONNECTIONS)
+            if connection_type == 'resource':
+                conn = session.resource(service, region_name=region,
+                                        config=config)
+            elif connection_type == 'client':
+                conn = session.client(service, region_name=region,
+                                      config=config)
+            else:
+                return None
+            _instrument(conn.meta.client
+                        if connection_type == 'resource' else conn)
+            _connections[key] = conn
+            if _observers:
+                notify('connection', service=service,
+                       connection_type=connection_type,
+                       seconds=time.time() - start)
+        return _connections[key]
+
+
+def add_observer(observer):
+    ''' Register observer(event, **fields) to receive library events
+
+        Events are 'connection', 'api_call', 'failed_attempt', 'items',
+        'filter', 'cache' and 'change_batch'; see aws.metrics for their
+        fields.
+    '''
+    with _lock:
+        _observers.append(observer)
+
+
+def remove_observer(observer):
+    ''' Stop sending library events to observer '''
+    with _lock:
+        if observer in _observers:
+            _observers.remove(observer)
+
+
+def notify(event, **fields):
+    ''' Send an event to all observers '''
+    for observer in list(_observers):
+        observer(event, **fields)
+
+
+def _instrument(client):
+    ''' Register botocore event handlers reporting API calls to observers
+        and pacing requests through the (service, region) RateLimiter '''
+    events = client.meta.events
+    events.register('before-call', _before_call)
+    events.register('after-call', _after_call)
+    events.register('after-call-error', _after_call_error)
+    events.register('needs-retry', _needs_retry)
+    service_model = client.meta.service_model
+    limiter = get_rate_limiter(service_model.service_name,
+                               client.meta.region_name)
+    events.register('before-send', partial(_before_send, limiter))
+    # runs ahead of the botocore retry handler of the service
+    events.register_first(
+        'needs-retry.{}'.format(service_model.service_id.hyphenize()),
+        partial(_limit_retry, client, limiter))
+
+
+def get_rate_limiter(service, region):
+    ''' Return the RateLimiter shared by the clients of service in region,
+        or by all clients of a global service '''
+    if service in GLOBAL_SERVICES:
+        region = None
+    with _lock:
+        if (service, region) not in _limiters:
+            _limiters[service, region] = RateLimiter(
+                SERVICE_RATES.get(service, DEFAULT_RATE))
+        return _limiters[service, region]
+
+
+def _before_send(limiter, **kwargs):
+    ''' Pace every HTTP attempt, retries included '''
+    limiter.acquire()
+
+
+def _limit_retry(client, limiter, response, operation, attempts,
+                 caught_exception, **kwargs):
+    ''' Adapt the rate to the outcome of an attempt, and stop botocore
+        retrying a failed attempt when the retry budget is spent '''
+    code = response[1].get('Error', {}).get('Code') if response else None
+    if code in THROTTLING_ERRORS:
+        limiter.throttled()
+    elif caught_exception is None and response[0].status_code < 500:
+        limiter.success()
+        return
+    if limiter.budget.withdraw():
+        return
+    _needs_retry(response, operation, attempts, caught_exception)
+    if caught_exception is not None:
+        raise caught_exception
+    raise client.exceptions.from_code(code)(response[1], operation.name)
+
+
+def _before_call(context, **kwargs):
+    ''' Record the start of an API call in its request context '''
+    context['fabboto_start'] = time.time()
+
+
+def _after_call(http_response, parsed, model, context, **kwargs):
+    ''' Report a completed API call '''
+    if not _observers:
+        return
+    notify('api_call',
+           service=model.service_model.service_name,
+           operation=model.name,
+           seconds=time.time() - context.get('fabboto_start', time.time()),
+           bytes=int(http_response.headers.get('content-length', 0)),
+           error=parsed.get('Error', {}).get('Code'))
+
+
+def _after_call_error(exception, context, event_name, **kwargs):
+    ''' Report an API call that failed without a response '''
+    if not _observers:
+        return
+    service, operation = event_name.split('.')[1:3]
+    notify('api_call', service=service, operation=operation,
+           seconds=time.time() - context.get('fabboto_start', time.time()),
+           bytes=0, error=type(exception).__name__)
+
+
+def _needs_retry(response, operation, attempts, caught_exception, **kwargs):
+    ''' Report failed attempts, which botocore may go on to retry '''
+    if not _observers:
+        return
+    code = None
+    if response is not None:
+        if response[0].status_code < 300:
+            return
+        code = response[1].get('Error', {}).get('Code')
+    notify('failed_attempt', service=operation.service_model.service_name,
+           operation=operation.name, attempts=attempts,
+           error=code or type(caught_exception).__name__,
+           throttled=code in THROTTLING_ERRORS)
+
+
+def set_pool_size(max_pool_connections):
+    ''' Set the connection pool size used by new connections.
+        Existing connections are closed so they pick up the new size. '''
+    global MAX_POOL_CONNECTIONS
+    with _lock:
+        MAX_POOL_CONNECTIONS = max_pool_connections
+        close_connections()
+
+
+def close_connections():
+    ''' Close and forget all shared connections '''
+    with _lock:
+        for conn in _connections.values():
+            # resources close through their underlying client
+            client = getattr(getattr(conn, 'meta', None), 'client', conn)
+            close = getattr(client, 'close', None)
+            if close:
+                close()
+        _connections.clear()
+
+
+def reset():
+    ''' Drop all shared connections and sessions '''
+    with _lock:
+        close_connections()
+        _sessions.clear()
+        _account_ids.clear()
+        _limiters.clear()
+
+
+def get_account_id(profile=None, ttl=None):
+    ''' Return the current user's AWS account ID
+
+        The ID is resolved with STS once per profile and memoized.
+        Pass ttl (seconds) to re-resolve values older than ttl.
+    '''
+    # concurrent callers share one STS call, made without holding _lock
+    with _creation_lock(('account_id', profile)):
+        with _lock:
+            if profile in _account_ids:
+                account_id, resolved = _account_ids[profile]
+                if ttl is None or resolved is None or \
+                        time.time() - resolved < ttl:
+                    return account_id
+        account_id = get_connection('client', 'sts', profile=profile) \
+            .get_caller_identity()['Account']
+        with _lock:
+            _account_ids[profile] = (account_id, time.time())
+        return account_id
+
+
+def set_account_id(account_id, profile=None):
+    ''' Override the account ID returned for profile without calling STS '''
+    with _lock:
+        _account_ids[profile] = (account_id, None)
+
+
+def is_throttling_error(error):
+    ''' Check if error is an AWS throttling response '''
+    return isinstance(error, ClientError) and \
+        error.response.get('Error', {}).get('Code') in THROTTLING_ERRORS
+
+
+def iter_concurrently(funcs, max_workers=10, ordered=True, buffer_size=100):
+    ''' Run generator functions in a thread pool and yield their items
+
+        Each function streams through a bounded queue, so producers block
+        rather than buffering whole result sets. With ordered=True items
+        are yielded function by function in the order given, otherwise
+        as soon as they arrive. Closing the generator stops the workers
+        and exceptions raised by a function are re-raised here. Workers
+        run in the FanOut target of the calling thread.
+    '''
+    funcs = list(funcs)
+    target = getattr(_context, 'target', None)
+    stop = threading.Event()
+    if ordered:
+        queues = [Queue.Queue(buffer_size) for _ in funcs]
+    else:
+        queues = [Queue.Queue(buffer_size)] * len(funcs)
+
+    def put(queue, message):
+        while not stop.is_set():
+            try:
+                queue.put(message, timeout=0.1)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def produce(func, queue):
+        # functions still queued when the consumer stops are not started
+        if stop.is_set():
+            return
+        _context.target = target
+        items = None
+        try:
+            items = func()
+            for item in items:
+                if not put(queue, ('item', item)):
+                    return
+        except Exception:
+            put(queue, ('error', sys.exc_info()))
+        else:
+            put(queue, ('done', None))
+        finally:
+            # close abandoned generators in the thread that ran them
+            close = getattr(items, 'close', None)
+            if close:
+                close()
+            _context.target = None
+
+    executor = ThreadPoolExecutor(max_workers)
+    futures = []
+    try:
+        for func, queue in zip(funcs, queues):
+            futures.append(executor.submit(produce, func, queue))
+        # ordered mode drains each queue in turn, unordered mode reads the
+        # shared queue until every producer has finished
+        pending = len(funcs)
+        position = 0
+        while pending:
+            kind, value = queues[position].get()
+            if kind == 'item':
+                yield value
+                continue
+            if kind == 'error':
+                raise value[0], value[1], value[2]
+            pending -= 1
+            if ordered:
+                position += 1
+    finally:
+        stop.set()
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def plan_filters(filters, key, values, size=MAX_FILTER_VALUES):
+    ''' Return one list of server-side filters per chunk of values for key,
+        each combined with the given list of filters '''
+    if not values:
+        return [filters]
+    return [filters + [{'Name': key, 'Values': chunk}]
+            for chunk in chunks(str_to_list(values), size)]
+
+
+def chunks(items, size):
+    ''' Generator function that yields lists of up to size items '''
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def select(items, key, n=None, largest=True):
+    ''' Return the largest (or smallest) item by key, or a list of the n
+        largest (or smallest) items, using a bounded heap over items '''
+    pick = heapq.nlargest if largest else heapq.nsmallest
+    if n is None:
+        selected = pick(1, items, key=key)
+        if not selected:
+            raise IndexError('no items to select from')
+        return selected[0]
+    return pick(n, items, key=key)
+
 
+def read_ahead(iterable, depth):
+    ''' Return an iterator that fetches up to depth items of iterable
+        ahead in a background thread.
 
-def get_account_id():
-    ''' Return the current user's AWS account ID '''
-    return boto3.client('sts').get_caller_identity()['Account']
+        The producer blocks once depth items are waiting, and closing
+        the iterator stops it after its current item.
+    '''
+    if depth < 1:
+        return iter(iterable)
+    return iter_concurrently([lambda: iterable], max_workers=1,
+                             buffer_size=depth)
 
 
 def str_to_list(obj):
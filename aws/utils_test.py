@@ -1,5 +1,60 @@
+import os
+import threading
+import time
 import unittest
-from utils import str_to_list, ProjectionFilter
+import utils
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+from utils import (str_to_list, ProjectionFilter, get_connection, reset,
+                   iter_concurrently, select, set_account_id, CollectionBase,
+                   Origin, FutureIterator, Projection, RateLimiter,
+                   get_rate_limiter, get_account_id, plan_filters,
+                   read_ahead)
+
+
+class RegionCollection(CollectionBase):
+    ''' Collection yielding its connection region, failing in eu-west-1 '''
+
+    CONNECTION_TYPE = 'client'
+    SERVICE = 'sqs'
+
+    def _all(self):
+        region = self.get_connection().meta.region_name
+        if region == 'eu-west-1':
+            raise ValueError(region)
+        yield region
+
+
+class ConcurrentRegionCollection(CollectionBase):
+    ''' Collection yielding its connection region from worker threads '''
+
+    CONNECTION_TYPE = 'client'
+    SERVICE = 'sqs'
+
+    def _all(self):
+        return iter_concurrently(
+            [lambda: iter([self.get_connection().meta.region_name])] * 3, 2)
+
+
+class ResourceRegionCollection(CollectionBase):
+    ''' Resource collection yielding its connection region '''
+
+    CONNECTION_TYPE = 'resource'
+    SERVICE = 'sqs'
+
+    def _all(self):
+        yield self.get_connection().meta.client.meta.region_name
+
+
+class FakeSTS(object):
+    ''' get_caller_identity returning a new account on every call '''
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_caller_identity(self):
+        self.calls += 1
+        return {'Account': str(self.calls)}
 
 
 class UtilsTestCase(unittest.TestCase):
@@ -18,8 +73,237 @@ class UtilsTestCase(unittest.TestCase):
         pfilter.add_filter('DBInstanceClass', ['db.t1.micro'])
         self.assertEqual(
             str(pfilter),
-            "?(DBSnapshotIdentifier == 'snapshot' || DBInstanceIdentifier == 'instance') && (Engine == 'mysql') && (DBInstanceClass == 'db.t1.micro')"
+            "?(DBInstanceIdentifier == 'instance' || DBSnapshotIdentifier == 'snapshot') && (DBInstanceClass == 'db.t1.micro') && (Engine == 'mysql')"
         )
 
+    def test_ProjectionFilter_search(self):
+        pages = [{'Items': [{'Id': str(i), 'Engine': 'mysql' if i % 2 else 'redis'}
+                            for i in range(100)]}] * 2
+        for ids in (['1', '2', '3'], [str(i) for i in range(0, 100, 3)]):
+            pfilter = ProjectionFilter()
+            pfilter.add_aggregate('Id', ids)
+            pfilter.add_filter('Engine', 'mysql')
+            expected = [str(i) for i in range(100)
+                        if str(i) in ids and i % 2] * 2
+            self.assertEqual(
+                [item['Id'] for item in pfilter.search(pages, 'Items')],
+                expected)
+
+    def test_plan_filters(self):
+        base = [{'Name': 'engine', 'Values': ['mysql']}]
+        self.assertEqual(plan_filters(base, 'db-instance-id', None), [base])
+        plans = plan_filters(base, 'db-instance-id', range(5), size=2)
+        self.assertEqual([plan[-1]['Values'] for plan in plans],
+                         [[0, 1], [2, 3], [4]])
+        self.assertTrue(all(plan[:-1] == base for plan in plans))
+        self.assertEqual(plan_filters([], 'id', 'a'),
+                         [[{'Name': 'id', 'Values': ['a']}]])
+
+    def test_get_connection(self):
+        client = get_connection('client', 'route53')
+        self.assertIs(get_connection('client', 'route53'), client)
+        self.assertIsNot(get_connection('client', 'route53', region='us-west-2'), client)
+        reset()
+        self.assertIsNot(get_connection('client', 'route53'), client)
+
+    def test_assume_role_unlocked(self):
+        client = get_connection('client', 'route53')
+        assuming = threading.Event()
+        assumed = threading.Event()
+
+        def assume_role_session(profile, role_arn):
+            assuming.set()
+            assumed.wait(5)
+            return 'session'
+
+        assume, utils._assume_role_session = \
+            utils._assume_role_session, assume_role_session
+        try:
+            thread = threading.Thread(
+                target=utils.get_session,
+                args=(None, 'arn:aws:iam::123:role/fabboto'))
+            thread.start()
+            assuming.wait(5)
+            # cached connections are returned while the role is assumed
+            self.assertIs(get_connection('client', 'route53'), client)
+            self.assertTrue(thread.is_alive())
+            assumed.set()
+            thread.join()
+            self.assertEqual(utils.get_session(
+                None, 'arn:aws:iam::123:role/fabboto'), 'session')
+        finally:
+            assumed.set()
+            utils._assume_role_session = assume
+            reset()
+
+    def test_get_account_id(self):
+        sts = FakeSTS()
+        utils._connections[('sts', 'client', None, None, None)] = sts
+        try:
+            self.assertEqual(get_account_id(), '1')
+            self.assertEqual(get_account_id(), '1')
+            self.assertEqual(get_account_id(ttl=60), '1')
+            utils._account_ids[None] = ('1', time.time() - 120)
+            self.assertEqual(get_account_id(ttl=60), '2')
+            set_account_id('123456789012')
+            self.assertEqual(get_account_id(ttl=60), '123456789012')
+            self.assertEqual(sts.calls, 2)
+        finally:
+            reset()
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter(rate=10)
+        limiter.throttled()
+        limiter.throttled()
+        self.assertEqual(limiter.rate, 5)
+        limiter._decreased -= 1
+        limiter.throttled()
+        self.assertEqual(limiter.rate, 2.5)
+        limiter.success()
+        self.assertEqual(limiter.rate, 2.9)
+        # global services are paced once, whatever the region
+        self.assertIs(get_rate_limiter('route53', 'us-east-1'),
+                      get_rate_limiter('route53', 'eu-west-1'))
+        self.assertIsNot(get_rate_limiter('ec2', 'us-east-1'),
+                         get_rate_limiter('ec2', 'eu-west-1'))
+        reset()
+
+    def test_retry_budget(self):
+        responses = []
+
+        class Raw(object):
+            def stream(self, **kwargs):
+                yield '{"__type": "ThrottlingException"}'
+
+        def throttle(**kwargs):
+            responses.append(kwargs['request'].url)
+            return AWSResponse(kwargs['request'].url, 400, {}, Raw())
+
+        # requests are signed before they are sent
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'test')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'test')
+        client = get_connection('client', 'dynamodb', region='us-east-1')
+        client.meta.events.register('before-send', throttle)
+        limiter = get_rate_limiter('dynamodb', 'us-east-1')
+        limiter.budget._balance = 2
+        limiter.budget.per_second = 0
+        with self.assertRaises(ClientError) as raised:
+            client.list_tables()
+        self.assertEqual(
+            raised.exception.response['Error']['Code'], 'ThrottlingException')
+        # the first attempt and two retries from the budget
+        self.assertEqual(len(responses), 3)
+        self.assertLess(limiter.rate, utils.DEFAULT_RATE)
+        reset()
+
+    def test_iter_concurrently(self):
+        funcs = [lambda i=i: iter(range(i * 10, i * 10 + 10)) for i in range(5)]
+        self.assertEqual(list(iter_concurrently(funcs, 3, buffer_size=2)),
+                         range(50))
+        self.assertEqual(sorted(iter_concurrently(funcs, 3, ordered=False)),
+                         range(50))
+
+    def test_iter_concurrently_close(self):
+        started = []
+
+        def produce(i):
+            started.append(i)
+            return iter(range(10))
+
+        # producers block on their full queues until the consumer closes
+        items = iter_concurrently([lambda i=i: produce(i) for i in range(200)],
+                                  max_workers=5, buffer_size=2)
+        next(items)
+        items.close()
+        time.sleep(0.3)
+        self.assertEqual(len(started), 5)
+
+    def test_iter_concurrently_error(self):
+        def fail():
+            yield 1
+            raise ValueError('boom')
+        with self.assertRaises(ValueError):
+            list(iter_concurrently([fail], 2))
+
+    def test_read_ahead(self):
+        state = {'produced': 0, 'closed': False}
+
+        def pages(fail=False):
+            try:
+                for i in range(100):
+                    if fail and i == 2:
+                        raise ValueError(i)
+                    state['produced'] += 1
+                    yield i
+            finally:
+                state['closed'] = True
+
+        items = read_ahead(pages(), 2)
+        self.assertEqual(next(items), 0)
+        time.sleep(0.2)
+        # two items queued and one waiting to be queued
+        self.assertLessEqual(state['produced'], 4)
+        items.close()
+        time.sleep(0.3)
+        self.assertTrue(state['closed'])
+        self.assertLessEqual(state['produced'], 4)
+        with self.assertRaises(ValueError):
+            list(read_ahead(pages(fail=True), 2))
+        self.assertEqual(list(read_ahead(iter(range(3)), 0)), range(3))
+
+    def test_select(self):
+        items = iter([3, 9, 1, 7])
+        self.assertEqual(select(items, abs), 9)
+        self.assertEqual(select([3, 9, 1, 7], abs, 2), [9, 7])
+        self.assertEqual(select([3, 9, 1, 7], abs, 2, largest=False), [1, 3])
+        self.assertRaises(IndexError, select, [], abs)
+
+    def test_FanOut(self):
+        set_account_id('123')
+        fan_out = RegionCollection().across(
+            ['us-east-1', 'us-west-2', 'eu-west-1'])
+        self.assertEqual(sorted(fan_out), [
+            (Origin('us-east-1', '123'), 'us-east-1'),
+            (Origin('us-west-2', '123'), 'us-west-2')])
+        self.assertEqual([target.region for target in fan_out.errors],
+                         ['eu-west-1'])
+        # workers of concurrent collections run in the target too
+        fan_out = ConcurrentRegionCollection().across(
+            ['us-east-1', 'us-west-2'])
+        self.assertEqual(sorted(fan_out),
+                         [(Origin('us-east-1', '123'), 'us-east-1')] * 3 +
+                         [(Origin('us-west-2', '123'), 'us-west-2')] * 3)
+        fan_out = ResourceRegionCollection().across(
+            ['us-east-1', 'us-west-2'])
+        self.assertEqual(sorted(fan_out), [
+            (Origin('us-east-1', '123'), 'us-east-1'),
+            (Origin('us-west-2', '123'), 'us-west-2')])
+        self.assertEqual(fan_out.errors, {})
+        reset()
+
+    def test_FutureIterator(self):
+        iterator = FutureIterator(iter(range(5)), batch_size=2, prefetch=2)
+        batches = [iterator.next_batch().result() for _ in range(4)]
+        self.assertEqual(batches, [[0, 1], [2, 3], [4], []])
+        iterator.close()
+        self.assertRaises(ValueError, iterator.next_batch)
+
+    def test_Projection(self):
+        projection = Projection({'id': 'InstanceId',
+                                 'az': 'Placement.AvailabilityZone'})
+        pages = [{'Reservations': [{'Instances': [
+            {'InstanceId': 'i-1', 'Placement': {'AvailabilityZone': 'a'}},
+            {'InstanceId': 'i-2'}]}]}]
+        records = list(projection.search(pages, 'Reservations[].Instances[]'))
+        self.assertEqual([(r.id, r.az) for r in records],
+                         [('i-1', 'a'), ('i-2', None)])
+        record = Projection(['InstanceId', 'Placement.AvailabilityZone'])(
+            pages[0]['Reservations'][0]['Instances'][0])
+        self.assertEqual(record.Placement_AvailabilityZone, 'a')
+        record = Projection(['Tags[0].Value', "Tags[?Key=='Name'].Value"])(
+            {'Tags': [{'Key': 'Name', 'Value': 'web'}]})
+        self.assertEqual(record.Tags_0_Value, 'web')
+        self.assertEqual(record.Tags_Key_Name_Value, ['web'])
+
 if __name__ == '__main__':
     unittest.main()